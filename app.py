@@ -1,6 +1,12 @@
 # app.py
 import os
 import base64
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
@@ -9,9 +15,65 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 import streamlit.components.v1 as components
 
 from game import get_game_html, GAME_HEIGHT
+from lab_data import (
+    BAR_AGGS,
+    CORR_SAMPLE_ROWS,
+    DEFAULT_POINT_BUDGET,
+    EXPORT_FORMATS,
+    FIT_MIN_POINTS,
+    HIST_BINS,
+    IC50_COL,
+    LARGE_PLOT_ROWS,
+    LOGP_COL,
+    MAX_BARS,
+    MAX_FILTER_CATEGORIES,
+    MW_COL,
+    PAGE_SIZES,
+    SAMPLE_SEED,
+    SAMPLE_SIZES,
+    SQL_MAX_ROWS,
+    SQL_SAMPLE_TABLE,
+    SQL_TABLE,
+    STREAM_THRESHOLD_BYTES,
+    UPLOAD_FORMATS,
+    WEBGL_SCATTER_FACTOR,
+    DatasetCache,
+    DiskStore,
+    ExportJob,
+    IngestJob,
+    RunningStats,
+    SessionBudget,
+    SortedIndex,
+    SqlEngine,
+    aggregate_bars,
+    align_frames,
+    columnar_columns,
+    compact_frame,
+    correlation_matrix,
+    decimate_line,
+    density_grid,
+    dose_response_columns,
+    druglikeness_columns,
+    filter_mask,
+    filter_signature,
+    fit_dose_response,
+    frame_window,
+    histogram_kde,
+    make_compound_data,
+    normalize_sql,
+    page_count,
+    profile_columns,
+    read_columnar,
+    read_csv_auto,
+    sample_rows,
+    upload_digest,
+    upload_format,
+    upload_size,
+)
 
 
 # ================= Helpers (secrets/env) =================
@@ -837,6 +899,10 @@ div[data-testid="stExpander"] details > div div[data-testid="stRadio"] label[dat
 )
 
 # ================= Helpers (UI) =================
+# How often the Lab page reruns while a background upload parse is running.
+INGEST_POLL_SECONDS = 0.75
+
+
 def html_page_title(icon: str, title: str):
     st.markdown(
         f'<div class="page-title"><span class="emoji">{icon}</span>{title}</div>',
@@ -848,17 +914,500 @@ def card(html_inner: str):
     st.markdown(f'<div class="card">{html_inner}</div>', unsafe_allow_html=True)
 
 
-def safe_read_csv(uploaded_file) -> pd.DataFrame:
+@st.cache_resource
+def get_dataset_cache() -> DatasetCache:
+    """
+    Process-wide parsed-dataset cache. Budget (MB) from LAB_CACHE_MB / [lab] cache_mb.
+    Spilled datasets go to LAB_SPILL_DIR / [lab] spill_dir, capped at LAB_SPILL_MB / [lab] spill_mb
+    (0 disables spill files: cold datasets are then just dropped and rebuilt on access).
+    """
     try:
-        return pd.read_csv(uploaded_file)
-    except UnicodeDecodeError:
-        return pd.read_csv(uploaded_file, encoding="latin-1")
-    except Exception:
-        return pd.DataFrame()
+        budget_mb = float(get_secret("LAB_CACHE_MB", "lab.cache_mb", default="1024"))
+    except ValueError:
+        budget_mb = 1024.0
+    spill_root = get_secret(
+        "LAB_SPILL_DIR", "lab.spill_dir", default=os.path.join(tempfile.gettempdir(), "drug_design_lab_spill")
+    )
+    try:
+        spill_mb = float(get_secret("LAB_SPILL_MB", "lab.spill_mb", default="8192"))
+    except ValueError:
+        spill_mb = 8192.0
+    spill_store = None
+    if spill_mb > 0:
+        try:
+            spill_store = DiskStore(spill_root, max_bytes=int(spill_mb * 1024 * 1024))
+        except OSError:
+            pass
+    return DatasetCache(max_bytes=int(budget_mb * 1024 * 1024), spill_store=spill_store)
+
+
+def session_budget():
+    """
+    This session's memory ledger, or None when disabled (LAB_SESSION_MB=0).
+    Budget (MB) from LAB_SESSION_MB / [lab] session_mb.
+    """
+    if "memory_budget" not in st.session_state:
+        try:
+            budget_mb = float(get_secret("LAB_SESSION_MB", "lab.session_mb", default="512"))
+        except ValueError:
+            budget_mb = 512.0
+        st.session_state.memory_budget = SessionBudget(int(budget_mb * 1024 * 1024)) if budget_mb > 0 else None
+    return st.session_state.memory_budget
+
+
+def hold_dataset(dataset_key) -> None:
+    """
+    Charge a dataset (upload, sample or derived view) and the results cached on it
+    (stats, indexes, SQL copies, fits, ...) to this session's budget for this run.
+    """
+    budget = session_budget()
+    size = get_dataset_cache().size_of(dataset_key) if dataset_key is not None else None
+    if budget is not None and size is not None:
+        budget.touch(dataset_key, size)
+
+
+def spill_cold_datasets() -> None:
+    """
+    End of a Lab page run: spill (in the background) this session's datasets that
+    the run did not use, coldest first, while the session is over its budget.
+    """
+    budget = session_budget()
+    if budget is None:
+        return
+    cache = get_dataset_cache()
+    for cold in budget.end_run():
+        threading.Thread(target=cache.spill, args=(cold,), name=f"spill:{cold}", daemon=True).start()
+
+
+def read_upload(uploaded_file, columns=None, stats=None) -> pd.DataFrame:
+    fmt = upload_format(uploaded_file.name)
+    uploaded_file.seek(0)
+    if fmt == "csv":
+        return read_csv_auto(uploaded_file, on_chunk=stats.update if stats is not None else None)
+    return read_columnar(uploaded_file, fmt, columns=columns)
+
+
+def parse_upload(uploaded_file, columns=None):
+    """
+    Read + compact one upload; returns (df, stats). Makes no Streamlit calls (safe in worker threads).
+    """
+    stats = RunningStats()
+    df = read_upload(uploaded_file, columns=columns, stats=stats)
+    if not df.empty:
+        df, saved = compact_frame(df)
+        df.attrs["bytes_saved"] = saved
+    return df, stats
+
+
+@st.cache_resource
+def get_disk_store():
+    """
+    Persistent parsed-upload store, or None when disabled (LAB_STORE_MB=0).
+    Directory from LAB_STORE_DIR / [lab] store_dir; budget (MB) from LAB_STORE_MB / [lab] store_mb.
+    """
+    root = get_secret("LAB_STORE_DIR", "lab.store_dir", default=os.path.expanduser("~/.cache/drug_design_lab"))
+    try:
+        budget_mb = float(get_secret("LAB_STORE_MB", "lab.store_mb", default="4096"))
+    except ValueError:
+        budget_mb = 4096.0
+    if budget_mb <= 0:
+        return None
+    try:
+        return DiskStore(root, max_bytes=int(budget_mb * 1024 * 1024))
+    except OSError:
+        return None
+
+
+def cache_parsed(cache: DatasetCache, key, df: pd.DataFrame, stats: RunningStats) -> None:
+    """
+    Put a freshly parsed upload in the memory cache, and persist it to the disk store in the background.
+    """
+    if df.empty:
+        return
+    store = get_disk_store()
+    if store is not None:
+        threading.Thread(target=store.put, args=(key, df), name=f"store:{key}", daemon=True).start()
+    cache.put(key, df)
+    # a latin-1 retry leaves `stats` with extra (partial) rows; keep it only if exact
+    if stats.rows == len(df):
+        cache.put_derived(key, "stats", stats)
+
+
+def upload_key(uploaded_file) -> str:
+    """
+    Content digest of an upload, hashed once per uploaded file: reruns look it up
+    in st.session_state.upload_digests by the upload's file_id and size.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is None:
+        return upload_digest(uploaded_file)
+    digests = st.session_state.setdefault("upload_digests", {})
+    ident = (file_id, uploaded_file.size)
+    if ident not in digests:
+        digests[ident] = upload_digest(uploaded_file)
+    return digests[ident]
+
+
+def load_upload(uploaded_file, columns=None):
+    """
+    Returns (dataset_key, df). Reruns with the same file bytes skip parsing.
+    `columns` projects columnar uploads (ignored for CSV). Parse errors propagate.
+    Large CSVs are parsed by a background IngestJob: until it finishes df is None
+    and the job sits in st.session_state.ingest_jobs[dataset_key].
+    """
+    cache = get_dataset_cache()
+    key = upload_key(uploaded_file)
+    if columns:
+        key = f"{key}:" + ",".join(columns)
+    df = cache.get(key)
+    if df is not None:
+        return key, df
+
+    store = get_disk_store()
+    df = store.get(key) if store is not None else None
+    if df is not None:
+        cache.put(key, df)
+        return key, df
+
+    if upload_format(uploaded_file.name) == "csv" and upload_size(uploaded_file) >= STREAM_THRESHOLD_BYTES:
+        jobs = st.session_state.setdefault("ingest_jobs", {})
+        job = jobs.get(key)
+        if job is None:
+            job = jobs[key] = IngestJob(uploaded_file, name=uploaded_file.name).start()
+        if not job.done:
+            return key, None
+        del jobs[key]
+        if job.error is not None:
+            raise job.error
+        cache_parsed(cache, key, job.result, job.stats)
+        return key, job.result
+
+    df, stats = parse_upload(uploaded_file, columns=columns)
+    cache_parsed(cache, key, df, stats)
+    return key, df
+
+
+def collect_ingest_jobs(current_key=None) -> None:
+    """
+    Drop every background ingest except the one for `current_key` (the upload on
+    screen), so a replaced or removed upload neither keeps the page polling nor
+    holds its parsed frame in session state. Jobs that already finished still feed
+    the cache; jobs still running are abandoned (their daemon thread just ends).
+    """
+    jobs = st.session_state.get("ingest_jobs")
+    if not jobs:
+        return
+    cache = get_dataset_cache()
+    for other, job in list(jobs.items()):
+        if other == current_key:
+            continue
+        del jobs[other]
+        if job.done and job.error is None:
+            cache_parsed(cache, other, job.result, job.stats)
+
+
+def load_uploads(uploaded_files, how: str = "union"):
+    """
+    Several uploads -> one dataset: uncached files are parsed concurrently in a
+    thread pool, then schemas are aligned (union / intersection) and concatenated.
+    Returns (dataset_key, df).
+    """
+    if len(uploaded_files) == 1:
+        return load_upload(uploaded_files[0])
+
+    cache = get_dataset_cache()
+    keys = [upload_key(f) for f in uploaded_files]
+    combined_key = f"multi:{how}:" + hashlib.blake2b("|".join(keys).encode(), digest_size=16).hexdigest()
+    df = cache.get(combined_key)
+    if df is not None:
+        return combined_key, df
+
+    store = get_disk_store()
+    frames = [cache.get(k) for k in keys]
+    for i, k in enumerate(keys):
+        if frames[i] is None and store is not None:
+            frames[i] = store.get(k)
+            if frames[i] is not None:
+                cache.put(k, frames[i])
+    missing = [i for i, f in enumerate(frames) if f is None]
+
+    def parse(i):
+        try:
+            return parse_upload(uploaded_files[i])
+        except Exception as e:
+            raise ValueError(f"{uploaded_files[i].name}: {e}") from e
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1)) as pool:
+            for i, (part, stats) in zip(missing, pool.map(parse, missing)):
+                cache_parsed(cache, keys[i], part, stats)
+                frames[i] = part
+
+    named = [(f, u.name) for f, u in zip(frames, uploaded_files) if not f.empty]
+    if not named:
+        return combined_key, pd.DataFrame()
+    df, saved = compact_frame(align_frames([f for f, _ in named], [n for _, n in named], how=how))
+    df.attrs["bytes_saved"] = saved
+    cache.put(combined_key, df)
+    return combined_key, df
+
+
+def load_sample(n_rows: int = SAMPLE_SIZES[0]):
+    """
+    Returns (dataset_key, df) for the seeded synthetic compound table; generated once per size.
+    """
+    cache = get_dataset_cache()
+    key = f"sample:{SAMPLE_SEED}:{n_rows}"
+    df = cache.get(key)
+    if df is None:
+        df, _ = compact_frame(make_compound_data(n_rows, seed=SAMPLE_SEED))
+        cache.put(key, df)
+    return key, df
+
+
+def dataset_stats(dataset_key, df: pd.DataFrame) -> RunningStats:
+    """
+    Numeric summary, computed once per cached dataset (or taken from streaming ingest).
+    """
+    if dataset_key is None:
+        return RunningStats.from_columns(df)
+    return get_dataset_cache().derived(dataset_key, "stats", lambda: RunningStats.from_columns(df))
+
+
+def dataset_profile(dataset_key, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Column profile (dtypes, nulls, cardinality, memory, min/median/max), built once per dataset.
+    """
+    if dataset_key is None:
+        return profile_columns(df)
+    return get_dataset_cache().derived(
+        dataset_key, "profile", lambda: profile_columns(df, dataset_stats(dataset_key, df))
+    )
+
+
+def numeric_columns(df: pd.DataFrame, dataset_key=None):
+    prof = dataset_profile(dataset_key, df)
+    return list(prof.index[prof["numeric"].to_numpy()])
+
+
+def with_druglikeness(dataset_key, df: pd.DataFrame):
+    """
+    Returns (key, df + pIC50 / Ro5 columns); the widened frame is cached as its own dataset.
+    """
+    if dataset_key is None:
+        return None, pd.concat([df, druglikeness_columns(df)], axis=1)
+    cache = get_dataset_cache()
+    key = f"{dataset_key}|druglike"
+    out = cache.get(key)
+    if out is None:
+        out = pd.concat([df, druglikeness_columns(df)], axis=1)
+        cache.put(key, out)
+    return key, out
+
+
+def with_dose_response(dataset_key, df: pd.DataFrame, id_col: str, conc_col: str, resp_col: str):
+    """
+    Returns (key, df + fitted 4PL columns). The per-compound fit is cached on the
+    dataset; the widened frame is cached as its own dataset.
+    """
+    if dataset_key is None:
+        fits = fit_dose_response(df, id_col, conc_col, resp_col)
+        return None, pd.concat([df, dose_response_columns(df, fits, id_col)], axis=1)
+    cache = get_dataset_cache()
+    name = f"fit:{id_col}:{conc_col}:{resp_col}"
+    key = f"{dataset_key}|{name}"
+    out = cache.get(key)
+    if out is None:
+        fits = cache.derived(dataset_key, name, lambda: fit_dose_response(df, id_col, conc_col, resp_col))
+        out = pd.concat([df, dose_response_columns(df, fits, id_col)], axis=1)
+        cache.put(key, out)
+    return key, out
+
+
+def dose_response_controls(dataset_key, df: pd.DataFrame):
+    """
+    Compound / concentration / response pickers for the 4PL fit; returns the
+    (id, conc, response) columns when fitting is switched on, else None.
+    """
+    nums = numeric_columns(df, dataset_key)
+    ids = [c for c in df.columns if c not in nums]
+    if not ids or len(nums) < 2:
+        st.caption("Needs a compound ID column plus numeric concentration and response columns.")
+        return None
+
+    def guess(options, words, fallback):
+        hits = [c for c in options if any(w in str(c).lower() for w in words)]
+        return options.index(hits[0]) if hits else fallback
+
+    a, b, c = st.columns(3)
+    with a:
+        id_col = st.selectbox("Compound", ids, index=guess(ids, ("compound", "id"), 0), key="fit_id")
+    with b:
+        conc_col = st.selectbox("Concentration", nums, index=guess(nums, ("conc", "dose"), 0), key="fit_conc")
+    with c:
+        resp_col = st.selectbox(
+            "Response", nums, index=guess(nums, ("resp", "inhib", "activity", "signal"), 1), key="fit_resp"
+        )
+    if conc_col == resp_col:
+        st.caption("Pick different concentration and response columns.")
+        return None
+    if not st.toggle("Add fitted columns (Fit IC50, Hill slope, R², ...)", key="fit_on"):
+        return None
+    return id_col, conc_col, resp_col
+
+
+def dataset_correlation(dataset_key, df: pd.DataFrame, columns, method: str) -> pd.DataFrame:
+    """
+    Correlation matrix cached per dataset view (the key already encodes filters).
+    """
+    if dataset_key is None:
+        return correlation_matrix(df, columns, method=method)
+    name = f"corr:{method}:" + ",".join(columns)
+    return get_dataset_cache().derived(dataset_key, name, lambda: correlation_matrix(df, columns, method=method))
+
+
+def column_values(dataset_key, df: pd.DataFrame, col: str) -> list:
+    """
+    Distinct values of a low-cardinality column (filter pick-list), cached per dataset.
+    """
+
+    def build():
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            return list(s.cat.categories)
+        vals = s.dropna().unique()
+        try:
+            return sorted(vals)
+        except TypeError:
+            return list(vals)
+
+    if dataset_key is None:
+        return build()
+    return get_dataset_cache().derived(dataset_key, f"values:{col}", build)
+
+
+def filtered_view(dataset_key, df: pd.DataFrame, filters):
+    """
+    Returns (view_key, view_df). Each distinct filter set is cached as its own
+    dataset, so stats/profile/plots for a filtered view are memoized like uploads.
+    Range filters use per-column SortedIndex objects built lazily on the base dataset.
+    """
+    if not filters:
+        return dataset_key, df
+    if dataset_key is None:
+        return None, df[filter_mask(df, filters)]
+
+    cache = get_dataset_cache()
+    view_key = f"{dataset_key}|filter:{filter_signature(filters)}"
+    view = cache.get(view_key)
+    if view is None:
+
+        def index_for(col):
+            return cache.derived(
+                dataset_key,
+                f"index:{col}",
+                lambda: SortedIndex(df[col].to_numpy(dtype="float64", na_value=np.nan)),
+            )
+
+        view = df[filter_mask(df, filters, index_for)]
+        cache.put(view_key, view)
+    return view_key, view
 
 
-def numeric_columns(df: pd.DataFrame):
-    return [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+def filter_controls(dataset_key, df: pd.DataFrame):
+    """
+    Filter widgets (numeric range sliders, category pick-lists); returns the active filter list.
+    """
+    prof = dataset_profile(dataset_key, df)
+    candidates = [c for c in prof.index if prof.at[c, "numeric"] or prof.at[c, "unique"] <= MAX_FILTER_CATEGORIES]
+    # widgets are keyed on the base dataset, so filters survive derived views (drug-likeness, 4PL fit)
+    base_key = dataset_key.split("|", 1)[0] if dataset_key is not None else None
+    filters = []
+    with st.expander("Filters", expanded=False):
+        cols = st.multiselect("Filter columns", candidates, key=f"filter_cols:{base_key}")
+        for col in cols:
+            wkey = f"filter:{base_key}:{col}"
+            if prof.at[col, "numeric"]:
+                lo, hi = float(prof.at[col, "min"]), float(prof.at[col, "max"])
+                if not (np.isfinite(lo) and np.isfinite(hi)) or lo >= hi:
+                    st.caption(f"{col}: single value, nothing to filter.")
+                    continue
+                sel_lo, sel_hi = st.slider(col, min_value=lo, max_value=hi, value=(lo, hi), key=wkey)
+                if sel_lo > lo or sel_hi < hi:
+                    filters.append(("range", col, sel_lo if sel_lo > lo else None, sel_hi if sel_hi < hi else None))
+            else:
+                picked = st.multiselect(col, column_values(dataset_key, df, col), key=wkey)
+                if picked:
+                    filters.append(("in", col, picked))
+    return filters
+
+
+def dataset_sql(dataset_key, df: pd.DataFrame) -> SqlEngine:
+    """
+    SQLite copy of the dataset (+ the 1,000-row sample as `compounds`), built once per dataset view.
+    """
+    if dataset_key is None:
+        return SqlEngine(df, load_sample(SAMPLE_SIZES[1])[1])
+    return get_dataset_cache().derived(
+        dataset_key, "sql", lambda: SqlEngine(df, load_sample(SAMPLE_SIZES[1])[1])
+    )
+
+
+def run_sql(dataset_key, df: pd.DataFrame, sql: str):
+    """
+    Returns (result, truncated); results are cached per dataset view and normalized query.
+    sqlite3.Error propagates (and is not cached).
+    """
+    sql = normalize_sql(sql)
+    if dataset_key is None:
+        return dataset_sql(dataset_key, df).query(sql)
+    cache = get_dataset_cache()
+
+    def build():
+        engine = dataset_sql(dataset_key, df)
+        result = engine.query(sql)
+        # the query may have added indexes: re-charge the engine's current size
+        cache.put_derived(dataset_key, "sql", engine)
+        return result
+
+    return cache.derived(dataset_key, f"sql:{sql}", build)
+
+
+def export_controls(dataset_key, df: pd.DataFrame) -> None:
+    """
+    Export the current view (derived columns and filters included). "Prepare" writes it
+    chunk by chunk to a temp file on a background ExportJob; the download button only
+    reads that file when it is clicked, and the file is deleted once it has been read.
+    """
+    fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_fmt")
+    suffix, mime = EXPORT_FORMATS[fmt]
+    tag = (dataset_key, fmt, len(df))
+    job = st.session_state.get("export_job")
+    if job is not None and (job.tag != tag or (job.done and not job.ready and job.error is None)):
+        # another view / format, or already downloaded: its file is no longer needed
+        job.discard()
+        job = st.session_state.export_job = None
+
+    if job is None or job.error is not None:
+        if job is not None:
+            st.error(f"Export failed: {job.error}")
+            job.discard()
+        if not st.button(f"Prepare {fmt} export ({len(df):,} rows)", key="export_prepare"):
+            return
+        job = st.session_state.export_job = ExportJob(df, fmt, tag=tag).start()
+
+    if not job.done:
+        st.progress(job.fraction, text=f"Writing {fmt}: {job.rows_written:,} of {job.total_rows:,} rows...")
+        return
+
+    # the click reruns the page, which then offers "Prepare" again (the file is gone after reading)
+    st.download_button(
+        f"Download {fmt} ({os.path.getsize(job.path) / 1024 / 1024:,.1f} MB)",
+        data=job.read,
+        file_name=f"lab_data{suffix}",
+        mime=mime,
+        key="export_download",
+    )
 
 
 def style_plotly(fig):
@@ -894,6 +1443,115 @@ def style_plotly(fig):
     return fig
 
 
+def build_figure(dataset_key, df: pd.DataFrame, chart_type: str, x_axis: str, y_axis: str, opts: dict):
+    """
+    Plotly figure for the Visualize tab (styled). opts["point_budget"] is set for Scatter / Line in large-data mode.
+    """
+    point_budget = opts.get("point_budget")
+    large = point_budget is not None
+
+    if chart_type == "Correlation":
+        corr = dataset_correlation(dataset_key, df, list(opts["columns"]), opts["method"])
+        fig = px.imshow(
+            corr,
+            zmin=-1,
+            zmax=1,
+            color_continuous_scale=[[0, "#8b5cf6"], [0.5, "rgba(10,12,22,0.9)"], [1, "#00e5ff"]],
+            text_auto=".2f" if len(corr) <= 20 else False,
+            aspect="auto",
+        )
+    elif chart_type == "Density":
+        counts, xc, yc = density_grid(
+            df[x_axis].to_numpy(dtype="float64", na_value=np.nan),
+            df[y_axis].to_numpy(dtype="float64", na_value=np.nan),
+        )
+        fig = go.Figure(
+            go.Heatmap(
+                z=np.log1p(counts),
+                x=xc,
+                y=yc,
+                customdata=counts,
+                hovertemplate="x=%{x:.4g}<br>y=%{y:.4g}<br>count=%{customdata:,.0f}<extra></extra>",
+                colorscale=[[0, "rgba(0,0,0,0)"], [0.15, "#8b5cf6"], [0.6, "#00e5ff"], [1, "#ff2bd6"]],
+                colorbar=dict(title="log(1+n)"),
+            )
+        )
+        fig.update_layout(xaxis_title=x_axis, yaxis_title=y_axis)
+    elif chart_type == "Histogram":
+        counts, edges, grid, kde = histogram_kde(
+            df[x_axis].to_numpy(dtype="float64", na_value=np.nan), bins=opts["bins"], log=opts["log"]
+        )
+        x_title = f"log10({x_axis})" if opts["log"] else x_axis
+        fig = go.Figure(
+            go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                width=np.diff(edges),
+                name="count",
+                marker=dict(color="#00e5ff", line=dict(width=1, color="rgba(255,43,214,0.35)")),
+                hovertemplate="%{x:.4g}<br>count=%{y:,.0f}<extra></extra>",
+            )
+        )
+        if opts["kde"]:
+            fig.add_trace(
+                go.Scatter(x=grid, y=kde, mode="lines", name="KDE", line=dict(width=3, color="#ff2bd6"), hoverinfo="skip")
+            )
+        fig.update_layout(xaxis_title=x_title, yaxis_title="count", bargap=0, showlegend=False)
+    elif chart_type == "Scatter" and large:
+        plot_df = sample_rows(df[list(dict.fromkeys([x_axis, y_axis]))], point_budget * WEBGL_SCATTER_FACTOR)
+        fig = px.scatter(plot_df, x=x_axis, y=y_axis, opacity=0.7, render_mode="webgl")
+        fig.update_traces(marker=dict(size=4, color="#00e5ff"))
+    elif chart_type == "Scatter":
+        fig = px.scatter(df, x=x_axis, y=y_axis, hover_data=list(df.columns), opacity=0.92)
+        fig.update_traces(marker=dict(size=10, color="#00e5ff", line=dict(width=1, color="rgba(255,43,214,0.35)")))
+    elif chart_type == "Line" and large:
+        plot_df = decimate_line(df, x_axis, y_axis, point_budget)
+        fig = px.line(plot_df, x=x_axis, y=y_axis, render_mode="webgl")
+        fig.update_traces(line=dict(width=2, color="#00e5ff"))
+    elif chart_type == "Line":
+        fig = px.line(df, x=x_axis, y=y_axis, markers=True)
+        fig.update_traces(line=dict(width=3, color="#00e5ff"), marker=dict(size=7, color="#00e5ff"))
+    else:
+        bars = aggregate_bars(df, x_axis, y_axis, agg=opts["agg"], max_bars=opts["max_bars"])
+        fig = px.bar(bars, x=x_axis, y=bars.columns[1])
+        fig.update_layout(bargap=0.05)
+        fig.update_traces(
+            marker_color="#00e5ff",
+            marker_line_width=1,
+            marker_line_color="rgba(255,43,214,0.35)",
+        )
+
+    return style_plotly(fig)
+
+
+@st.cache_resource
+def get_figure_cache() -> DatasetCache:
+    """
+    Process-wide LRU of built figures, sized by their JSON payload.
+    Budget (MB) from LAB_FIGURE_CACHE_MB / [lab] figure_cache_mb.
+    """
+    try:
+        budget_mb = float(get_secret("LAB_FIGURE_CACHE_MB", "lab.figure_cache_mb", default="256"))
+    except ValueError:
+        budget_mb = 256.0
+    return DatasetCache(max_bytes=int(budget_mb * 1024 * 1024))
+
+
+def cached_figure(dataset_key, df: pd.DataFrame, chart_type: str, x_axis: str, y_axis: str, opts: dict):
+    """
+    build_figure() memoized on (dataset view, chart type, axes, options).
+    """
+    if dataset_key is None:
+        return build_figure(dataset_key, df, chart_type, x_axis, y_axis, opts)
+    key = (dataset_key, chart_type, x_axis, y_axis, tuple(sorted(opts.items())))
+    cache = get_figure_cache()
+    fig = cache.get(key)
+    if fig is None:
+        fig = build_figure(dataset_key, df, chart_type, x_axis, y_axis, opts)
+        cache.put(key, fig, nbytes=len(fig.to_json()))
+    return fig
+
+
 # ================= NAV: callback + close =================
 def on_nav_change():
     sel = st.session_state.get("nav_selection", st.session_state.page)
@@ -1130,45 +1788,153 @@ elif st.session_state.page == "AI Projects":
 
 elif st.session_state.page == "Lab Data Explorer":
     html_page_title("🧪", "Lab Data Explorer")
+    if session_budget() is not None:
+        session_budget().begin_run()  # datasets used by this run are pinned in memory
 
-    compound_data = pd.DataFrame(
-        {
-            "Compound ID": [f"CMPD-{i}" for i in range(1, 11)],
-            "IC50 (nM)": np.random.uniform(10, 1000, 10),
-            "LogP": np.random.uniform(0.2, 7, 10),
-            "Molecular Weight": np.random.uniform(150, 500, 10),
-        }
+    uploaded_files = st.file_uploader(
+        "Upload Experimental Data (CSV, Parquet, Feather, Arrow) — one file or many (e.g. per plate)",
+        type=list(UPLOAD_FORMATS.keys()),
+        accept_multiple_files=True,
     )
+    uploaded = uploaded_files[0] if len(uploaded_files or []) == 1 else None
+    collect_ingest_jobs(upload_key(uploaded) if uploaded is not None else None)
+
+    ingest_job = None
+    if uploaded_files:
+        load_cols = None
+        combine_how = "union"
+        fmt = upload_format(uploaded.name) if uploaded is not None else "csv"
+        if uploaded is None:
+            combine_how = st.radio(
+                "Combine columns across files", ["union", "intersection"], horizontal=True, key="combine_how"
+            )
+        elif fmt != "csv":
+            try:
+                all_cols = columnar_columns(uploaded, fmt)
+            except Exception:
+                all_cols = []
+            if all_cols:
+                picked = st.multiselect(
+                    "Columns to load",
+                    options=all_cols,
+                    default=all_cols,
+                    key=f"load_cols:{uploaded.name}:{uploaded.size}",
+                )
+                if picked and len(picked) < len(all_cols):
+                    load_cols = picked
 
-    uploaded = st.file_uploader("Upload Experimental Data (CSV)", type="csv")
-
-    if uploaded:
-        df = safe_read_csv(uploaded)
-        if df.empty:
-            st.error("Could not read that CSV. Try exporting as UTF-8 and re-upload.")
-            df = compound_data
+        try:
+            if uploaded is not None:
+                dataset_key, df = load_upload(uploaded, columns=load_cols)
+            else:
+                with st.spinner(f"Parsing {len(uploaded_files)} files..."):
+                    dataset_key, df = load_uploads(uploaded_files, how=combine_how)
+            read_error = "the file contains no rows" if df is not None and df.empty else ""
+        except Exception as e:
+            dataset_key, df = None, pd.DataFrame()
+            read_error = str(e) or type(e).__name__
+            if len(read_error) > 400:
+                read_error = read_error[:400] + "..."
+
+        if read_error:
+            st.error(f"Could not read that file: {read_error}")
+            dataset_key, df = load_sample()
+        elif df is None:
+            # background ingest still running: show progress + the first parsed rows
+            ingest_job = st.session_state.ingest_jobs[dataset_key]
+            st.progress(ingest_job.fraction, text=f"Parsing in the background: {ingest_job.rows:,} rows so far...")
+            dataset_key = None
+            df = ingest_job.preview if ingest_job.preview is not None else pd.DataFrame()
+        elif uploaded is None:
+            st.success(f"{len(uploaded_files)} files combined: {len(df):,} rows.")
         else:
             st.success("File uploaded successfully!")
+            saved = df.attrs.get("bytes_saved", 0)
+            if saved > 0:
+                st.caption(f"Compacted dtypes: saved {saved / 1024 / 1024:,.1f} MB in memory.")
     else:
         st.markdown(
             '<div class="inlineNote"><b>Showing sample dataset</b> (upload a CSV to view your own).</div>',
             unsafe_allow_html=True,
         )
-        df = compound_data
+        sample_size = st.selectbox(
+            "Sample size (rows)",
+            SAMPLE_SIZES,
+            format_func=lambda n: f"{n:,}",
+            key="sample_size",
+        )
+        with st.spinner("Generating sample data..."):
+            dataset_key, df = load_sample(sample_size)
+
+    hold_dataset(dataset_key)
+    if ingest_job is None and any(c in df.columns for c in (IC50_COL, LOGP_COL, MW_COL)):
+        if st.toggle("Drug-likeness columns (pIC50, Lipinski Ro5)", key="druglike"):
+            dataset_key, df = with_druglikeness(dataset_key, df)
+            hold_dataset(dataset_key)
+
+    if ingest_job is None:
+        with st.expander("Dose-response fit (4PL)", expanded=False):
+            fit_cols = dose_response_controls(dataset_key, df)
+            if fit_cols is not None:
+                with st.spinner("Fitting 4PL curves..."):
+                    dataset_key, df = with_dose_response(dataset_key, df, *fit_cols)
+                st.caption(
+                    f"Fit IC50 is in {fit_cols[1]} units; compounds with fewer than "
+                    f"{FIT_MIN_POINTS} usable points are left blank."
+                )
+        if fit_cols is not None:
+            hold_dataset(dataset_key)
+
+    filters = filter_controls(dataset_key, df) if ingest_job is None else []
+    if filters:
+        n_total = len(df)
+        dataset_key, df = filtered_view(dataset_key, df, filters)
+        hold_dataset(dataset_key)
+        st.caption(f"Filters: {len(df):,} of {n_total:,} rows match.")
 
     lab_tab = st.radio(
         label="e",
-        options=["Data", "Visualize", "Quick stats"],
+        options=["Data", "Visualize", "Quick stats", "SQL"],
         horizontal=True,
         key="lab_tab",
         label_visibility="collapsed",
     )
 
-    if lab_tab == "Data":
-        st.dataframe(df, use_container_width=True, hide_index=True)
+    if ingest_job is not None and lab_tab != "Data":
+        st.info("Still parsing the upload. Visualize, Quick stats and SQL open on the full dataset once it is ready.")
+
+    elif lab_tab == "Data":
+        if ingest_job is not None and df.empty:
+            st.caption("Waiting for the first rows...")
+        elif ingest_job is not None:
+            st.caption(f"Preview: first {len(df):,} rows (full dataset still loading).")
+        with st.expander("Column profile", expanded=False):
+            st.dataframe(dataset_profile(dataset_key, df), use_container_width=True)
+        if ingest_job is None:
+            with st.expander("Export", expanded=False):
+                export_controls(dataset_key, df)
+
+        if len(df) <= PAGE_SIZES[0]:
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            p1, p2 = st.columns(2)
+            with p1:
+                page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key="data_page_size")
+            n_pages = page_count(len(df), page_size)
+            # clamp before the widget is built (page size / dataset may have changed)
+            if st.session_state.get("data_page", 1) > n_pages:
+                st.session_state.data_page = n_pages
+            with p2:
+                page = int(st.number_input("Page", min_value=1, max_value=n_pages, step=1, key="data_page"))
+            window = frame_window(df, page, page_size)
+            start = (page - 1) * page_size
+            st.dataframe(window, use_container_width=True, hide_index=True)
+            st.caption(
+                f"Rows {start + 1:,}–{start + len(window):,} of {len(df):,} • page {page:,}/{n_pages:,}"
+            )
 
     elif lab_tab == "Visualize":
-        num_cols = numeric_columns(df)
+        num_cols = numeric_columns(df, dataset_key)
         if len(num_cols) < 2:
             st.warning("Need at least two numeric columns to plot.")
         else:
@@ -1178,39 +1944,95 @@ elif st.session_state.page == "Lab Data Explorer":
             with b:
                 y_axis = st.selectbox("Y-axis", options=num_cols, index=1, key="y_axis")
             with c:
-                chart_type = st.radio("Chart", ["Scatter", "Line", "Bar"], horizontal=True, key="chart_type")
-
-            if chart_type == "Scatter":
-                fig = px.scatter(df, x=x_axis, y=y_axis, hover_data=list(df.columns), opacity=0.92)
-                fig.update_traces(
-                    marker=dict(size=10, color="#00e5ff", line=dict(width=1, color="rgba(255,43,214,0.35)"))
+                chart_type = st.radio(
+                    "Chart", ["Scatter", "Line", "Bar", "Histogram", "Density", "Correlation"], horizontal=True, key="chart_type"
                 )
-            elif chart_type == "Line":
-                fig = px.line(df, x=x_axis, y=y_axis, markers=True)
-                fig.update_traces(line=dict(width=3, color="#00e5ff"), marker=dict(size=7, color="#00e5ff"))
-            else:
-                fig = px.bar(df, x=x_axis, y=y_axis)
-                fig.update_traces(
-                    marker_color="#00e5ff",
-                    marker_line_width=1,
-                    marker_line_color="rgba(255,43,214,0.35)",
+
+            # only Scatter / Line are decimated, so only they carry a point budget (figure cache key)
+            large = len(df) > LARGE_PLOT_ROWS and chart_type in ("Scatter", "Line")
+            opts = {}
+            if large:
+                point_budget = opts["point_budget"] = int(
+                    st.number_input(
+                        "Point budget (large-data mode)",
+                        min_value=500,
+                        max_value=200_000,
+                        value=DEFAULT_POINT_BUDGET,
+                        step=500,
+                        key="point_budget",
+                    )
                 )
 
-            fig = style_plotly(fig)
+            if chart_type == "Correlation":
+                opts["method"] = st.radio("Method", ["pearson", "spearman"], horizontal=True, key="corr_method")
+                opts["columns"] = tuple(num_cols)
+                if len(df) > CORR_SAMPLE_ROWS:
+                    st.caption(f"Correlation on a {CORR_SAMPLE_ROWS:,}-row uniform sample of {len(df):,} rows.")
+            elif chart_type == "Bar":
+                g1, g2 = st.columns(2)
+                with g1:
+                    opts["agg"] = st.selectbox("Aggregate", BAR_AGGS, key="bar_agg")
+                with g2:
+                    opts["max_bars"] = st.slider("Max bars", min_value=5, max_value=200, value=MAX_BARS, key="max_bars")
+            elif chart_type == "Histogram":
+                g1, g2, g3 = st.columns(3)
+                with g1:
+                    opts["bins"] = st.slider("Bins", min_value=10, max_value=200, value=HIST_BINS, key="hist_bins")
+                with g2:
+                    opts["log"] = st.checkbox("Log10 scale", value=x_axis == IC50_COL, key="hist_log")
+                with g3:
+                    opts["kde"] = st.checkbox("KDE curve", value=True, key="hist_kde")
+                st.caption(f"Distribution of {x_axis} ({len(df):,} rows binned on the server).")
+            elif chart_type == "Scatter" and large:
+                shown = min(len(df), point_budget * WEBGL_SCATTER_FACTOR)
+                st.caption(f"Large-data mode: WebGL, {shown:,} of {len(df):,} points (uniform sample).")
+            elif chart_type == "Line" and large:
+                st.caption(f"Large-data mode: LTTB-decimated to at most {point_budget:,} of {len(df):,} points.")
+
+            fig = cached_figure(dataset_key, df, chart_type, x_axis, y_axis, opts)
             st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
+    elif lab_tab == "SQL":
+        with st.expander("Tables", expanded=False):
+            st.markdown(
+                f"**{SQL_TABLE}**: the current dataset ({len(df):,} rows, filters included)  \n"
+                f"**{SQL_SAMPLE_TABLE}**: the {SAMPLE_SIZES[1]:,}-row sample compound table  \n"
+                'Quote names with spaces, e.g. `"IC50 (nM)"`.'
+            )
+            st.caption(", ".join(f'"{c}"' for c in df.columns))
+        sql = st.text_area(
+            "Query (read-only SQLite)", value=f"SELECT * FROM {SQL_TABLE} LIMIT 100", height=140, key="sql_query"
+        )
+        if st.button("Run query", key="sql_run"):
+            st.session_state.sql_last = sql
+        last = st.session_state.get("sql_last")
+        if last and last.strip():
+            try:
+                with st.spinner("Running query..."):
+                    result, truncated = run_sql(dataset_key, df, last)
+            except sqlite3.Error as e:
+                st.error(f"SQL error: {e}")
+            else:
+                more = f" (first {SQL_MAX_ROWS:,} shown)" if truncated else ""
+                st.caption(f"{len(result):,} rows{more}.")
+                st.dataframe(result, use_container_width=True, hide_index=True)
+
     else:
+        nums = numeric_columns(df, dataset_key)
         c1, c2, c3 = st.columns(3)
         with c1:
             st.metric("Rows", f"{len(df):,}")
         with c2:
             st.metric("Columns", f"{df.shape[1]:,}")
         with c3:
-            st.metric("Numeric cols", f"{len(numeric_columns(df)):,}")
+            st.metric("Numeric cols", f"{len(nums):,}")
 
-        nums = numeric_columns(df)
         if nums:
-            st.dataframe(df[nums].describe().T, use_container_width=True)
+            st.dataframe(dataset_stats(dataset_key, df).to_frame(nums), use_container_width=True)
+
+    # re-charge the view: this run may have cached new derived results on it (stats, indexes, SQL)
+    hold_dataset(dataset_key)
+    spill_cold_datasets()
 
 elif st.session_state.page == "Publications":
     html_page_title("🌐", "Publications")
@@ -1356,3 +2178,14 @@ st.markdown(
     """,
     unsafe_allow_html=True,
 )
+
+# ================= Background job polling =================
+# Rerun while an upload is still parsing or an export is still writing; each rerun
+# shows progress or picks up the finished result.
+_export_job = st.session_state.get("export_job")
+if st.session_state.page == "Lab Data Explorer" and (
+    any(not job.done for job in st.session_state.get("ingest_jobs", {}).values())
+    or (_export_job is not None and not _export_job.done)
+):
+    time.sleep(INGEST_POLL_SECONDS)
+    st.rerun()
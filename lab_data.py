@@ -0,0 +1,1633 @@
+# lab_data.py
+import codecs
+import csv
+import hashlib
+import multiprocessing
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+# ================= Ingestion =================
+# Uploads at or above this size are parsed in fixed-size chunks instead of one shot.
+STREAM_THRESHOLD_BYTES = 50 * 1024 * 1024
+CSV_CHUNK_ROWS = 250_000
+# Bytes from the head of a CSV used to guess encoding and delimiter.
+SNIFF_BYTES = 64 * 1024
+
+
+def upload_size(uploaded_file) -> int:
+    """
+    Size in bytes of an uploaded file (Streamlit UploadedFile or any seekable file).
+    """
+    size = getattr(uploaded_file, "size", None)
+    if size is not None:
+        return int(size)
+    pos = uploaded_file.tell()
+    uploaded_file.seek(0, 2)
+    size = uploaded_file.tell()
+    uploaded_file.seek(pos)
+    return size
+
+
+def read_csv_chunked(
+    source, chunk_rows: int = CSV_CHUNK_ROWS, on_progress=None, on_chunk=None, **read_kwargs
+) -> pd.DataFrame:
+    """
+    Parse a CSV in chunks of `chunk_rows` rows and build the frame incrementally.
+    The reader pulls the file through a small buffer, so the decoded text of the
+    whole upload never exists next to the parsed frame.
+
+    on_chunk(chunk) sees every parsed chunk (e.g. RunningStats.update);
+    on_progress(rows_parsed, bytes_consumed) is called after every chunk.
+    """
+    chunks = []
+    rows = 0
+    with pd.read_csv(source, chunksize=chunk_rows, **read_kwargs) as reader:
+        for chunk in reader:
+            chunks.append(chunk)
+            rows += len(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+            if on_progress is not None:
+                try:
+                    pos = source.tell()
+                except Exception:
+                    pos = 0
+                on_progress(rows, pos)
+
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def sniff_csv(sample: bytes):
+    """
+    Guess (encoding, delimiter) from the first bytes of a CSV.
+    Encoding: BOM -> utf-8-sig / utf-16, valid UTF-8 -> utf-8, else latin-1.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        try:
+            sample.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError as e:
+            # a multi-byte character cut off by the sample boundary is still UTF-8
+            truncated = e.start >= len(sample) - 3 and e.reason == "unexpected end of data"
+            encoding = "utf-8" if truncated else "latin-1"
+
+    text = sample.decode(encoding, errors="ignore")
+    head = "\n".join(text.splitlines()[:50])
+    try:
+        delimiter = csv.Sniffer().sniff(head, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+    return encoding, delimiter
+
+
+def sniff_upload(uploaded_file):
+    pos = uploaded_file.tell()
+    uploaded_file.seek(0)
+    sample = uploaded_file.read(SNIFF_BYTES)
+    uploaded_file.seek(pos)
+    return sniff_csv(sample)
+
+
+def _check_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # pyarrow types a column holding invalid UTF-8 as binary and pandas hands
+    # back bytes objects instead of raising; surface it like the C engine would
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object:
+            first = s.first_valid_index()
+            if first is not None and isinstance(s.at[first], bytes):
+                raise UnicodeDecodeError("utf-8", s.at[first], 0, 1, f"invalid UTF-8 in column {col!r}")
+    return df
+
+
+def read_csv_fast(source, **read_kwargs) -> pd.DataFrame:
+    """
+    One-shot parse with pyarrow's multithreaded CSV engine; falls back to the
+    C engine for files pyarrow rejects. Invalid UTF-8 raises UnicodeDecodeError.
+    """
+    try:
+        return _check_text_columns(pd.read_csv(source, engine="pyarrow", **read_kwargs))
+    except ValueError as e:
+        if isinstance(e, UnicodeDecodeError):
+            raise
+        source.seek(0)
+        return pd.read_csv(source, **read_kwargs)
+
+
+# ================= Multi-file alignment =================
+SOURCE_COL = "Source file"
+
+
+def _unified_dtype(dtypes, missing_somewhere: bool) -> str:
+    if all(pd.api.types.is_bool_dtype(d) for d in dtypes) and not missing_somewhere:
+        return "bool"
+    if all(pd.api.types.is_numeric_dtype(d) for d in dtypes):
+        if not missing_somewhere and all(
+            pd.api.types.is_integer_dtype(d) or pd.api.types.is_bool_dtype(d) for d in dtypes
+        ):
+            return "int64"
+        return "float64"
+    return "string[pyarrow]"
+
+
+def align_frames(frames, names, how: str = "union", source_col: str = SOURCE_COL) -> pd.DataFrame:
+    """
+    Concatenate per-file frames under one schema.
+      how="union"         -> every column seen in any file (missing values -> NA)
+      how="intersection"  -> only columns present in every file
+    Types are unified per column: int+int -> int64, any float or missing -> float64,
+    any non-numeric -> Arrow string. `source_col` records the file each row came from.
+    """
+    frames = list(frames)
+    if how == "intersection":
+        cols = [c for c in frames[0].columns if all(c in f.columns for f in frames[1:])]
+    else:
+        cols = list(dict.fromkeys(c for f in frames for c in f.columns))
+
+    targets = {}
+    for c in cols:
+        dtypes = [f[c].dtype for f in frames if c in f.columns]
+        targets[c] = _unified_dtype(dtypes, any(c not in f.columns for f in frames))
+
+    parts = []
+    for f, name in zip(frames, names):
+        part = {}
+        for c in cols:
+            if c in f.columns:
+                part[c] = f[c].astype(targets[c])
+            else:
+                fill = pd.NA if targets[c].startswith("string") else np.nan
+                part[c] = pd.Series(fill, index=f.index, dtype=targets[c])
+        part = pd.DataFrame(part, index=f.index)
+        if source_col:
+            part[source_col] = name
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+# ================= Sample data =================
+SAMPLE_SEED = 42
+SAMPLE_SIZES = [10, 1_000, 100_000, 1_000_000, 10_000_000]
+
+
+def make_compound_data(n_rows: int = 10, seed: int = SAMPLE_SEED) -> pd.DataFrame:
+    """
+    Deterministic synthetic screening table (same seed + size -> same rows):
+      - IC50 (nM): log-normal, median ~200 nM, clipped to 0.1 nM – 100 µM
+      - Molecular Weight: ~N(400, 90) Da, clipped to 150–900
+      - LogP: rises with MW (~+0.6 per 100 Da) around 2.5, clipped to -3–8
+    """
+    rng = np.random.default_rng(seed)
+    ids = pc.binary_join_element_wise("CMPD-", pc.cast(pa.array(np.arange(1, n_rows + 1)), pa.string()), "")
+    mw = np.clip(rng.normal(400.0, 90.0, n_rows), 150.0, 900.0)
+    logp = np.clip(0.006 * (mw - 400.0) + rng.normal(2.5, 1.2, n_rows), -3.0, 8.0)
+    ic50 = np.clip(10.0 ** rng.normal(2.3, 0.8, n_rows), 0.1, 100_000.0)
+    return pd.DataFrame(
+        {
+            "Compound ID": ids.to_pandas(types_mapper=pd.ArrowDtype).astype("string[pyarrow]"),
+            "IC50 (nM)": np.round(ic50, 2),
+            "LogP": np.round(logp, 2),
+            "Molecular Weight": np.round(mw, 2),
+        }
+    )
+
+
+def read_csv_auto(source, on_chunk=None, on_progress=None) -> pd.DataFrame:
+    """
+    Sniff encoding + delimiter from the head of the file, then parse once.
+    Files below STREAM_THRESHOLD_BYTES go through the multithreaded engine;
+    larger ones stream in chunks (on_chunk / on_progress see every chunk).
+    """
+    encoding, sep = sniff_upload(source)
+    if upload_size(source) < STREAM_THRESHOLD_BYTES:
+        read = read_csv_fast
+    else:
+        read = partial(read_csv_chunked, on_chunk=on_chunk, on_progress=on_progress)
+    try:
+        return read(source, encoding=encoding, sep=sep)
+    except UnicodeDecodeError:
+        # sniff sample was clean UTF-8 but a later byte is not
+        source.seek(0)
+        return read(source, encoding="latin-1", sep=sep)
+
+
+# ================= Columnar formats =================
+# extension -> reader; Feather v2 is the Arrow IPC file format
+UPLOAD_FORMATS = {
+    "csv": "csv",
+    "parquet": "parquet",
+    "pq": "parquet",
+    "feather": "ipc",
+    "arrow": "ipc",
+    "ipc": "ipc",
+}
+
+
+def upload_format(name: str) -> str:
+    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return UPLOAD_FORMATS.get(ext, "csv")
+
+
+def _arrow_source(source):
+    """
+    Paths are memory-mapped; in-memory uploads are wrapped without copying.
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        return pa.memory_map(str(source), "r")
+    try:
+        return pa.BufferReader(pa.py_buffer(source.getbuffer()))
+    except AttributeError:
+        source.seek(0)
+        return pa.BufferReader(source.read())
+
+
+def _open_ipc(src):
+    try:
+        return pa.ipc.open_file(src)
+    except pa.ArrowInvalid:
+        src.seek(0)
+        return pa.ipc.open_stream(src)
+
+
+def columnar_columns(source, fmt: str):
+    """
+    Column names from the file footer/schema only (no data pages are read).
+    """
+    src = _arrow_source(source)
+    if fmt == "parquet":
+        return list(pq.read_schema(src).names)
+    return list(_open_ipc(src).schema.names)
+
+
+def read_columnar(source, fmt: str, columns=None) -> pd.DataFrame:
+    """
+    Read Parquet / Feather / Arrow IPC, loading only `columns` when given.
+    """
+    src = _arrow_source(source)
+    if fmt == "parquet":
+        table = pq.read_table(src, columns=columns)
+    elif columns:
+        # IPC file format: only the selected columns' buffers are read/decompressed
+        try:
+            table = feather.read_table(src, columns=columns, memory_map=True)
+        except pa.ArrowInvalid:
+            src.seek(0)
+            table = _open_ipc(src).read_all().select(columns)  # IPC stream: no random access
+    else:
+        table = _open_ipc(src).read_all()
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+# ================= Compaction =================
+def _compact_series(s: pd.Series, float_rtol: float, category_ratio: float) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        out = pd.to_numeric(s, downcast="integer")
+        if len(s) and s.min() >= 0:
+            # unsigned only when it halves the width (e.g. 200 fits uint8, not int8)
+            as_uint = pd.to_numeric(s, downcast="unsigned")
+            if as_uint.dtype.itemsize < out.dtype.itemsize:
+                return as_uint
+        return out
+    if pd.api.types.is_float_dtype(s):
+        vals = s.to_numpy()
+        finite = vals[np.isfinite(vals)]
+        if len(finite) == len(vals) and np.array_equal(finite, np.round(finite)):
+            as_int = pd.to_numeric(s.astype("int64"), downcast="integer")
+            if np.array_equal(as_int.to_numpy(dtype="float64"), vals):
+                return as_int
+        if s.dtype != np.float32:
+            f32 = vals.astype(np.float32)
+            if np.allclose(f32, vals, rtol=float_rtol, atol=0.0, equal_nan=True):
+                return pd.Series(f32, index=s.index, name=s.name)
+        return s
+    if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            return s
+        n = len(s)
+        if n and s.nunique(dropna=True) <= category_ratio * n:
+            return s.astype("category")
+        if pd.api.types.infer_dtype(s, skipna=True) == "string":
+            return s.astype("string[pyarrow]")
+    return s
+
+
+def compact_frame(df: pd.DataFrame, float_rtol: float = 1e-6, category_ratio: float = 0.5):
+    """
+    Shrink a frame after load:
+      - ints -> smallest signed int that holds the range, uint only when narrower (lossless)
+      - floats -> int when every value is integral, else float32 within `float_rtol`
+      - strings -> category when repeated (unique/rows <= category_ratio), else Arrow strings
+    Returns (compacted_df, bytes_saved).
+    """
+    before = frame_nbytes(df)
+    cols = [_compact_series(df.iloc[:, i], float_rtol, category_ratio) for i in range(df.shape[1])]
+    out = pd.concat(cols, axis=1) if cols else df.copy()
+    out.columns = df.columns
+    out.index = df.index
+    return out, before - frame_nbytes(out)
+
+
+# ================= Table windowing =================
+PAGE_SIZES = [100, 500, 1000, 5000]
+
+
+def page_count(n_rows: int, page_size: int) -> int:
+    return max(1, -(-n_rows // page_size))
+
+
+def frame_window(df: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
+    """
+    Rows of 1-based `page`; only this slice is serialized to the browser.
+    """
+    page = min(max(page, 1), page_count(len(df), page_size))
+    start = (page - 1) * page_size
+    return df.iloc[start : start + page_size]
+
+
+# ================= Large-data plotting =================
+# Above this many rows the Visualize tab switches to WebGL + decimation.
+LARGE_PLOT_ROWS = 20_000
+DEFAULT_POINT_BUDGET = 5_000
+# WebGL scatter can carry more points than an SVG line before the browser struggles.
+WEBGL_SCATTER_FACTOR = 10
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: row positions of `n_out` points that keep the
+    visual shape of the (x, y) series. First and last points are always kept.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+        else:
+            nlo, nhi = n - 1, n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        seg_x = x[lo:hi]
+        seg_y = y[lo:hi]
+        area = np.abs((x[a] - avg_x) * (seg_y - y[a]) - (x[a] - seg_x) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def decimate_line(df: pd.DataFrame, x: str, y: str, budget: int) -> pd.DataFrame:
+    """
+    LTTB-decimate a line series (row order) down to `budget` points.
+    Non-monotonic x falls back to row position for the triangle areas.
+    """
+    sub = df[list(dict.fromkeys([x, y]))].dropna()  # x may equal y
+    if len(sub) <= budget:
+        return sub
+    xs = sub[x].to_numpy(dtype="float64")
+    if not (np.all(np.diff(xs) >= 0) or np.all(np.diff(xs) <= 0)):
+        xs = np.arange(len(sub), dtype="float64")
+    idx = lttb_indices(xs, sub[y].to_numpy(dtype="float64"), budget)
+    return sub.iloc[idx]
+
+
+def sample_rows(df: pd.DataFrame, n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Uniform row sample (stable across reruns for the same seed).
+    """
+    if len(df) <= n:
+        return df
+    idx = np.sort(np.random.default_rng(seed).choice(len(df), size=n, replace=False))
+    return df.iloc[idx]
+
+
+def density_grid(x, y, bins: int = 150):
+    """
+    2D histogram of finite (x, y) pairs for the Density chart.
+    Returns (counts[ny, nx], x_centers, y_centers); size depends only on `bins`.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    ok = np.isfinite(x) & np.isfinite(y)
+    counts, xe, ye = np.histogram2d(x[ok], y[ok], bins=bins)
+    return counts.T, (xe[:-1] + xe[1:]) / 2, (ye[:-1] + ye[1:]) / 2
+
+
+HIST_BINS = 50
+KDE_GRID_POINTS = 512
+
+
+def histogram_kde(values, bins: int = HIST_BINS, log: bool = False, grid_points: int = KDE_GRID_POINTS):
+    """
+    Histogram + binned Gaussian KDE of the finite values (log10 of the positive
+    values when `log`). The KDE convolves a `grid_points`-bin histogram with a
+    Gaussian kernel (Silverman bandwidth, IQR read off the same fine histogram),
+    so the data is scanned twice and everything after that is O(grid_points).
+    Returns (counts, edges, grid, kde): kde is scaled to counts per histogram
+    bin so both share one axis. Output size depends only on bins / grid_points.
+    """
+    v = np.asarray(values, dtype="float64")
+    if log:
+        v = v[v > 0]
+        v = np.log10(v)
+    v = v[np.isfinite(v)]
+    if not len(v):
+        return np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0)
+    lo, hi = float(v.min()), float(v.max())
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    counts, edges = np.histogram(v, bins=bins, range=(lo, hi))
+    fine, fine_edges = np.histogram(v, bins=grid_points, range=(lo, hi))
+    grid = (fine_edges[:-1] + fine_edges[1:]) / 2
+    dx = (hi - lo) / grid_points
+
+    cdf = np.cumsum(fine) / len(v)
+    q25, q75 = np.interp([0.25, 0.75], cdf, grid)
+    std = float(v.std())
+    spread = min(std, (q75 - q25) / 1.34) or std
+    h = max(0.9 * spread * len(v) ** -0.2, dx)
+    radius = min(int(np.ceil(4 * h / dx)), grid_points - 1)
+    t = np.arange(-radius, radius + 1) * dx
+    kernel = np.exp(-0.5 * (t / h) ** 2)
+    kernel /= kernel.sum()
+    smooth = np.convolve(fine, kernel, mode="full")[radius : radius + grid_points]
+    return counts, edges, grid, smooth * (grid_points / bins)
+
+
+# Correlations above this many rows are computed on a uniform row sample.
+CORR_SAMPLE_ROWS = 250_000
+
+
+def correlation_matrix(df: pd.DataFrame, columns, method: str = "pearson", max_rows: int = CORR_SAMPLE_ROWS):
+    """
+    Full Pearson/Spearman matrix over `columns` in one DataFrame.corr call
+    (pairwise-complete), on a stable sample when the frame is large.
+    """
+    sub = sample_rows(df[list(columns)], max_rows).astype("float64")
+    return sub.corr(method=method)
+
+
+BAR_AGGS = ["mean", "median", "count", "min", "max"]
+MAX_BARS = 50
+
+
+def aggregate_bars(df: pd.DataFrame, x: str, y: str, agg: str = "mean", max_bars: int = MAX_BARS) -> pd.DataFrame:
+    """
+    One bar per x group instead of one per row.
+    Numeric x with more than `max_bars` distinct values is cut into equal-width
+    bins (labelled by bin centre); other x keeps its `max_bars` most frequent values.
+    Returns a frame with columns [x, "<agg> of <y>"].
+    """
+    sub = df[list(dict.fromkeys([x, y]))].dropna(subset=[x])  # x may equal y
+    xs = sub[x]
+    label = f"{agg} of {y}"
+    if pd.api.types.is_numeric_dtype(xs) and xs.nunique() > max_bars:
+        vals = xs.to_numpy(dtype="float64", na_value=np.nan)
+        finite = np.isfinite(vals)
+        if not finite.all():
+            sub, vals = sub[finite], vals[finite]
+        edges = np.histogram_bin_edges(vals, bins=max_bars)
+        codes = np.clip(np.searchsorted(edges, vals, side="right") - 1, 0, max_bars - 1)
+        grouped = sub[y].groupby(codes).agg(agg)
+        centers = (edges[:-1] + edges[1:]) / 2
+        return pd.DataFrame({x: centers[grouped.index.to_numpy()], label: grouped.to_numpy()})
+
+    grouped = sub[y].groupby(xs, observed=True, sort=True).agg(agg)
+    if len(grouped) > max_bars:
+        top = xs.value_counts().index[:max_bars]
+        grouped = grouped[grouped.index.isin(top)]
+    return pd.DataFrame({x: grouped.index, label: grouped.to_numpy()})
+
+
+# ================= Statistics =================
+# Rows kept in the reservoir sample that backs approximate quantiles.
+QUANTILE_SAMPLE_ROWS = 20_000
+STATS_CHUNK_ROWS = 1_000_000
+# Frames at least this wide are summarised in column partitions on a thread pool
+# (NumPy reductions release the GIL, so partitions run on separate cores).
+PARALLEL_PROFILE_COLUMNS = 256
+
+
+def column_partitions(columns, max_workers: int = None) -> list:
+    """
+    Split `columns` into contiguous partitions for a worker pool: one per worker
+    (two per worker to smooth uneven columns), or a single partition when the
+    frame is narrower than PARALLEL_PROFILE_COLUMNS or only one core is available.
+    """
+    columns = list(columns)
+    workers = max_workers or os.cpu_count() or 1
+    if len(columns) < PARALLEL_PROFILE_COLUMNS or workers < 2:
+        return [columns]
+    n_parts = min(len(columns), workers * 2)
+    return [list(part) for part in np.array_split(np.array(columns, dtype=object), n_parts)]
+
+
+def map_column_partitions(df: pd.DataFrame, fn, max_workers: int = None) -> list:
+    """
+    fn(sub_frame) for each column partition of df, in column order.
+    """
+    parts = column_partitions(df.columns, max_workers)
+    if len(parts) == 1:
+        return [fn(df)]
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return list(pool.map(lambda cols: fn(df[cols]), parts))
+
+
+class RunningStats:
+    """
+    Single-pass, mergeable summary of the numeric columns of a (chunked) frame:
+    count / mean / variance (Chan's parallel update) / min / max per column,
+    plus a uniform row reservoir for approximate quantiles.
+    """
+
+    def __init__(self, sample_rows: int = QUANTILE_SAMPLE_ROWS, seed: int = 0):
+        self.sample_rows = sample_rows
+        self.columns = []
+        self.rows = 0
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.sample = np.zeros((0, 0))
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, chunk_rows: int = STATS_CHUNK_ROWS, **kwargs) -> "RunningStats":
+        stats = cls(**kwargs)
+        for start in range(0, len(df), chunk_rows):
+            stats.update(df.iloc[start : start + chunk_rows])
+        return stats
+
+    @classmethod
+    def from_columns(cls, df: pd.DataFrame, max_workers: int = None, **kwargs) -> "RunningStats":
+        """
+        from_frame over column partitions in parallel (see map_column_partitions);
+        identical to from_frame for frames narrower than PARALLEL_PROFILE_COLUMNS.
+        """
+        parts = map_column_partitions(df, lambda part: cls.from_frame(part, **kwargs), max_workers)
+        return parts[0] if len(parts) == 1 else cls.hstack(parts)
+
+    @classmethod
+    def hstack(cls, parts) -> "RunningStats":
+        """
+        Join summaries of disjoint column sets taken over the same rows.
+        """
+        out = cls(sample_rows=parts[0].sample_rows)
+        out.columns = [c for p in parts for c in p.columns]
+        out.rows = max(p.rows for p in parts)
+        for field in ("count", "mean", "m2", "min", "max"):
+            setattr(out, field, np.concatenate([getattr(p, field) for p in parts]))
+        # each part's reservoir is a uniform row sample, so equal-length slices
+        # side by side still give per-column uniform samples
+        k = min(p.sample.shape[0] for p in parts)
+        out.sample = np.hstack([p.sample[:k].reshape(k, len(p.columns)) for p in parts])
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.count, self.mean, self.m2, self.min, self.max, self.sample))
+
+    def _ensure_columns(self, cols) -> np.ndarray:
+        new = [c for c in cols if c not in self.columns]
+        if new:
+            k = len(new)
+            self.columns.extend(new)
+            self.count = np.concatenate([self.count, np.zeros(k)])
+            self.mean = np.concatenate([self.mean, np.zeros(k)])
+            self.m2 = np.concatenate([self.m2, np.zeros(k)])
+            self.min = np.concatenate([self.min, np.full(k, np.nan)])
+            self.max = np.concatenate([self.max, np.full(k, np.nan)])
+            pad = np.full((self.sample.shape[0], k), np.nan)
+            self.sample = np.hstack([self.sample, pad]) if self.sample.size else pad
+        pos = {c: i for i, c in enumerate(self.columns)}
+        return np.array([pos[c] for c in cols], dtype=np.int64)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        cols = [c for c in chunk.columns if pd.api.types.is_numeric_dtype(chunk[c])]
+        idx = self._ensure_columns(cols)
+        X = chunk[cols].to_numpy(dtype="float64", na_value=np.nan) if cols else np.zeros((len(chunk), 0))
+
+        n_b = np.sum(~np.isnan(X), axis=0).astype("float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(n_b > 0, np.nansum(X, axis=0) / n_b, 0.0)
+        m2_b = np.nansum((X - mean_b) ** 2, axis=0)
+
+        n_a, mean_a = self.count[idx], self.mean[idx]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean[idx] = np.where(n > 0, mean_a + delta * n_b / n, 0.0)
+            self.m2[idx] = self.m2[idx] + m2_b + np.where(n > 0, delta**2 * n_a * n_b / n, 0.0)
+        self.count[idx] = n
+        if len(X):
+            self.min[idx] = np.fmin(self.min[idx], np.fmin.reduce(X, axis=0))
+            self.max[idx] = np.fmax(self.max[idx], np.fmax.reduce(X, axis=0))
+
+        full = np.full((len(X), len(self.columns)), np.nan)
+        full[:, idx] = X
+        self._merge_sample(full, len(X))
+        self.rows += len(X)
+
+    def merge(self, other: "RunningStats") -> None:
+        """
+        Fold another summary (e.g. from a parallel chunk) into this one.
+        """
+        idx = self._ensure_columns(other.columns)
+        n_a, n_b = self.count[idx], other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean[idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean[idx] = np.where(n > 0, self.mean[idx] + delta * n_b / n, 0.0)
+            self.m2[idx] = self.m2[idx] + other.m2 + np.where(n > 0, delta**2 * n_a * n_b / n, 0.0)
+        self.count[idx] = n
+        self.min[idx] = np.fmin(self.min[idx], other.min)
+        self.max[idx] = np.fmax(self.max[idx], other.max)
+
+        full = np.full((other.sample.shape[0], len(self.columns)), np.nan)
+        full[:, idx] = other.sample
+        self._merge_sample(full, other.rows)
+        self.rows += other.rows
+
+    def _merge_sample(self, rows: np.ndarray, rows_seen: int) -> None:
+        # `rows` is a uniform sample (or all) of `rows_seen` rows; keep each side
+        # in proportion to how many rows it stands for
+        if rows_seen == 0:
+            return
+        total = self.rows + rows_seen
+        k = min(self.sample_rows, self.sample.shape[0] + len(rows))
+        take_new = self._rng.binomial(k, rows_seen / total)
+        take_new = min(take_new, len(rows))
+        take_old = min(k - take_new, self.sample.shape[0])
+        take_new = min(k - take_old, len(rows))
+        old = self.sample[self._rng.choice(self.sample.shape[0], take_old, replace=False)] if take_old else None
+        new = rows[self._rng.choice(len(rows), take_new, replace=False)]
+        self.sample = new if old is None else np.vstack([old, new])
+
+    def quantiles(self, qs=(0.25, 0.5, 0.75)) -> np.ndarray:
+        if not self.sample.shape[0]:
+            return np.full((len(qs), len(self.columns)), np.nan)
+        with warnings.catch_warnings():
+            # all-NaN columns are expected (non-numeric chunks, empty columns)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanquantile(self.sample, qs, axis=0)
+
+    def to_frame(self, columns=None) -> pd.DataFrame:
+        """
+        Same layout as df.describe().T (quantiles are approximate past the sample size).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(np.where(self.count > 1, self.m2 / (self.count - 1), np.nan))
+        q = self.quantiles()
+        out = pd.DataFrame(
+            {
+                "count": self.count,
+                "mean": np.where(self.count > 0, self.mean, np.nan),
+                "std": std,
+                "min": self.min,
+                "25%": q[0],
+                "50%": q[1],
+                "75%": q[2],
+                "max": self.max,
+            },
+            index=pd.Index(self.columns, dtype="object"),
+        )
+        if columns is not None:
+            out = out.loc[[c for c in columns if c in out.index]]
+        return out
+
+
+# ================= Column profile =================
+def _profile_part(df: pd.DataFrame) -> pd.DataFrame:
+    names = list(df.columns)
+    return pd.DataFrame(
+        {
+            "dtype": [str(df[c].dtype) for c in names],
+            "numeric": [pd.api.types.is_numeric_dtype(df[c]) for c in names],
+            "nulls": df.isna().sum().to_numpy(),
+            "unique": [df[c].nunique(dropna=True) for c in names],
+            "memory (bytes)": df.memory_usage(index=False, deep=True).to_numpy(),
+        },
+        index=pd.Index(names, dtype="object"),
+    )
+
+
+def profile_columns(df: pd.DataFrame, stats: RunningStats = None, max_workers: int = None) -> pd.DataFrame:
+    """
+    One row per column: dtype, numeric flag, nulls, distinct values, memory,
+    and (numeric only) min / median / max. Built once per dataset and shared by
+    every tab. Numeric summaries come from `stats` when given. Wide frames are
+    profiled in column partitions across a thread pool.
+    """
+    if stats is None:
+        stats = RunningStats.from_columns(df, max_workers)
+    summary = stats.to_frame()
+    prof = pd.concat(map_column_partitions(df, _profile_part, max_workers))
+    names, numeric = list(prof.index), prof["numeric"].tolist()
+    for field in ("min", "50%", "max"):
+        prof[field] = [
+            summary.at[c, field] if is_num and c in summary.index else np.nan for c, is_num in zip(names, numeric)
+        ]
+    return prof
+
+
+# ================= Derived columns =================
+IC50_COL = "IC50 (nM)"
+LOGP_COL = "LogP"
+MW_COL = "Molecular Weight"
+# Lipinski rule-of-five limits (a property "violates" when it is above its limit)
+RO5_LIMITS = {MW_COL: 500.0, LOGP_COL: 5.0, "HBD": 5.0, "HBA": 10.0}
+
+
+def druglikeness_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Whole-column medicinal-chemistry metrics for whichever source columns exist:
+      pIC50 = 9 - log10(IC50 nM)     (NaN for IC50 <= 0)
+      Ro5 <col> violation            one flag per available Ro5 property
+      Ro5 violations / Ro5 pass      count, and pass = at most one violation
+    Returns only the new columns (same index as df).
+    """
+    out = {}
+    if IC50_COL in df.columns:
+        ic50 = df[IC50_COL].to_numpy(dtype="float64", na_value=np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["pIC50"] = np.where(ic50 > 0, 9.0 - np.log10(ic50), np.nan).astype("float32")
+
+    flags = {}
+    for col, limit in RO5_LIMITS.items():
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+            flags[f"Ro5 {col} violation"] = df[col].to_numpy(dtype="float64", na_value=np.nan) > limit
+    if flags:
+        out.update(flags)
+        violations = np.sum(list(flags.values()), axis=0).astype("uint8")
+        out["Ro5 violations"] = violations
+        out["Ro5 pass"] = violations <= 1
+    return pd.DataFrame(out, index=df.index)
+
+
+# ================= Filters =================
+# Columns with at most this many distinct values get a pick-list filter.
+MAX_FILTER_CATEGORIES = 200
+
+
+class SortedIndex:
+    """
+    Sorted view of one numeric column (argsort built once, NaN excluded);
+    range predicates become two binary searches instead of a full scan.
+    """
+
+    def __init__(self, values):
+        vals = np.asarray(values, dtype="float64")
+        order = np.argsort(vals, kind="stable")  # NaN sorts last
+        self.n_rows = len(vals)
+        self.n_valid = int(np.count_nonzero(~np.isnan(vals)))
+        self.order = order[: self.n_valid]
+        self.sorted = vals[self.order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.sorted.nbytes
+
+    def range_positions(self, lo=None, hi=None) -> np.ndarray:
+        """
+        Row positions with lo <= value <= hi (either bound may be None).
+        """
+        a = 0 if lo is None else int(np.searchsorted(self.sorted, lo, side="left"))
+        b = self.n_valid if hi is None else int(np.searchsorted(self.sorted, hi, side="right"))
+        return self.order[a:max(a, b)]
+
+    def range_mask(self, lo=None, hi=None) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.range_positions(lo, hi)] = True
+        return mask
+
+
+def filter_signature(filters) -> str:
+    """
+    Stable text key for a filter list (used to cache filtered views).
+    """
+    parts = []
+    for kind, col, *args in filters:
+        if kind == "in":
+            args = [sorted(map(str, args[0]))]
+        parts.append(f"{kind}:{col}:{args!r}")
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def filter_mask(df: pd.DataFrame, filters, index_for=None) -> np.ndarray:
+    """
+    AND of all filters as one boolean mask. Filters are tuples:
+      ("range", column, lo, hi)   -- numeric, inclusive, either bound may be None
+      ("in", column, values)      -- keep rows whose value is in `values`
+    index_for(column) -> SortedIndex lets range filters reuse a prebuilt index.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for kind, col, *args in filters:
+        s = df[col]
+        if kind == "range":
+            lo, hi = args
+            if index_for is not None:
+                mask &= index_for(col).range_mask(lo, hi)
+            else:
+                vals = s.to_numpy(dtype="float64", na_value=np.nan)
+                keep = ~np.isnan(vals)
+                if lo is not None:
+                    keep &= vals >= lo
+                if hi is not None:
+                    keep &= vals <= hi
+                mask &= keep
+        elif kind == "in":
+            wanted = list(args[0])
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                codes = s.cat.categories.get_indexer(wanted)
+                mask &= np.isin(s.cat.codes.to_numpy(), codes[codes >= 0])
+            else:
+                mask &= s.isin(wanted).to_numpy()
+        else:
+            raise ValueError(f"Unknown filter kind: {kind}")
+    return mask
+
+
+# ================= Dose-response =================
+FIT_COLUMNS = ["Fit bottom", "Fit top", "Fit IC50", "Fit Hill slope", "Fit R²", "Fit points"]
+FIT_BATCH_COMPOUNDS = 4_096
+FIT_ITERATIONS = 60
+FIT_MIN_POINTS = 4
+_LN10 = np.log(10.0)
+
+
+def fourpl(log_conc, bottom, top, log_ic50, hill):
+    """
+    Four-parameter logistic on log10 concentration (hill > 0: falls from top to bottom).
+    """
+    return bottom + (top - bottom) / (1.0 + 10.0 ** np.clip(hill * (log_conc - log_ic50), -30, 30))
+
+
+def _fourpl_jacobian(X, P):
+    b, t, c, h = (P[:, i : i + 1] for i in range(4))
+    u = 10.0 ** np.clip(h * (X - c), -30, 30)
+    d = 1.0 + u
+    f = b + (t - b) / d
+    g = (t - b) * u * _LN10 / d**2
+    J = np.stack([1.0 - 1.0 / d, 1.0 / d, g * h, -g * (X - c)], axis=-1)
+    return f, J
+
+
+def _fit_batch(batch):
+    """
+    Levenberg-Marquardt for a batch of padded series at once: X / Y are
+    (compounds, points) log10 concentrations / responses, W is 1 for real
+    points and 0 for padding. Every step is one batched 4x4 solve.
+    Returns (params[compounds, 4], r2[compounds]).
+    """
+    X, Y, W = batch
+    n = W.sum(axis=1)
+    big = np.where(W > 0, 1.0, np.nan)
+    lo, hi = np.nanmin(Y * big, axis=1), np.nanmax(Y * big, axis=1)
+    xm = (X * W).sum(axis=1) / n
+    ym = (Y * W).sum(axis=1) / n
+    slope = ((X - xm[:, None]) * (Y - ym[:, None]) * W).sum(axis=1)
+    # start at the concentration whose response is closest to the midpoint
+    mid = np.argmin(np.where(W > 0, np.abs(Y - ((lo + hi) / 2)[:, None]), np.inf), axis=1)
+    P = np.column_stack([lo, hi, X[np.arange(len(X)), mid], np.where(slope <= 0, 1.0, -1.0)])
+
+    # keep IC50 within a few decades of the tested range and the slope finite
+    x_lo = np.where(W > 0, X, np.inf).min(axis=1) - 3.0
+    x_hi = np.where(W > 0, X, -np.inf).max(axis=1) + 3.0
+
+    f, J = _fourpl_jacobian(X, P)
+    sse = (((Y - f) ** 2) * W).sum(axis=1)
+    lam = np.full(len(X), 1e-2)
+    eye = np.eye(4)
+    for _ in range(FIT_ITERATIONS):
+        JW = J * W[..., None]
+        JTJ = np.matmul(JW.transpose(0, 2, 1), J)
+        JTr = np.matmul(JW.transpose(0, 2, 1), ((Y - f) * W)[..., None])
+        A = JTJ + lam[:, None, None] * (JTJ * eye + 1e-9 * eye)
+        try:
+            step = np.linalg.solve(A, JTr)[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.matmul(np.linalg.pinv(A), JTr)[..., 0]
+        trial = P + np.nan_to_num(step)
+        trial[:, 2] = np.clip(trial[:, 2], x_lo, x_hi)
+        trial[:, 3] = np.clip(trial[:, 3], -10.0, 10.0)
+        f_new, J_new = _fourpl_jacobian(X, trial)
+        sse_new = (((Y - f_new) ** 2) * W).sum(axis=1)
+        better = sse_new < sse
+        gain = np.where(better, sse - sse_new, 0.0)
+        P = np.where(better[:, None], trial, P)
+        f = np.where(better[:, None], f_new, f)
+        J = np.where(better[:, None, None], J_new, J)
+        sse = np.where(better, sse_new, sse)
+        lam = np.clip(np.where(better, lam / 3.0, lam * 4.0), 1e-9, 1e9)
+        # converged: no compound still improving by more than a relative 1e-9
+        if not np.any(better & (gain > 1e-9 * sse)) and np.all(lam > 1e-2):
+            break
+
+    sst = (((Y - ym[:, None]) ** 2) * W).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r2 = np.where(sst > 0, 1.0 - sse / sst, np.nan)
+    return P, r2
+
+
+def _padded_batches(ids, log_conc, resp, batch_compounds):
+    # rows grouped by compound code (stable), then each batch padded to its longest series
+    order = np.argsort(ids, kind="stable")
+    ids, log_conc, resp = ids[order], log_conc[order], resp[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    counts = np.diff(np.r_[starts, len(ids)])
+    pos = np.arange(len(ids)) - np.repeat(starts, counts)
+    group = np.repeat(np.arange(len(starts)), counts)
+    for a in range(0, len(starts), batch_compounds):
+        b = min(a + batch_compounds, len(starts))
+        rows = slice(starts[a], starts[b] if b < len(starts) else len(ids))
+        width = int(counts[a:b].max())
+        X = np.zeros((b - a, width))
+        Y = np.zeros((b - a, width))
+        W = np.zeros((b - a, width))
+        g, p = group[rows] - a, pos[rows]
+        X[g, p], Y[g, p], W[g, p] = log_conc[rows], resp[rows], 1.0
+        yield ids[starts[a:b]], counts[a:b], (X, Y, W)
+
+
+def fit_dose_response(
+    df: pd.DataFrame,
+    id_col: str,
+    conc_col: str,
+    resp_col: str,
+    batch_compounds: int = FIT_BATCH_COMPOUNDS,
+    max_workers: int = None,
+) -> pd.DataFrame:
+    """
+    4PL fit of response vs concentration for every compound in long-format data
+    (one row per measurement). Compounds are fitted in padded, vectorized
+    batches spread over a process pool. Returns one row per compound (index =
+    compound id) with FIT_COLUMNS; IC50 is in the concentration column's units.
+    Compounds with fewer than FIT_MIN_POINTS usable points (conc > 0, finite
+    response) get NaN parameters.
+    """
+    conc = df[conc_col].to_numpy(dtype="float64", na_value=np.nan)
+    resp = df[resp_col].to_numpy(dtype="float64", na_value=np.nan)
+    ok = (conc > 0) & np.isfinite(conc) & np.isfinite(resp) & df[id_col].notna().to_numpy()
+    # integer compound codes: grouping sorts ints instead of id strings
+    codes, names = pd.factorize(df[id_col].iloc[np.flatnonzero(ok)])
+    if not len(codes):
+        return pd.DataFrame(columns=FIT_COLUMNS, index=pd.Index([], name=id_col))
+    batches = list(_padded_batches(codes, np.log10(conc[ok]), resp[ok], batch_compounds))
+
+    workers = min(len(batches), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        # spawn, not fork: the caller is a multi-threaded server process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            fits = list(pool.map(_fit_batch, [arrays for _, _, arrays in batches]))
+    else:
+        fits = [_fit_batch(arrays) for _, _, arrays in batches]
+
+    P = np.vstack([p for p, _ in fits])
+    r2 = np.concatenate([r for _, r in fits])
+    n = np.concatenate([c for _, c, _ in batches])
+    P[n < FIT_MIN_POINTS] = np.nan
+    r2[n < FIT_MIN_POINTS] = np.nan
+    # report hill > 0 (top = low-concentration plateau) whichever sign the fit converged to
+    flip = P[:, 3] < 0
+    P[flip] = P[flip][:, [1, 0, 2, 3]] * [1, 1, 1, -1]
+    return pd.DataFrame(
+        {
+            "Fit bottom": P[:, 0],
+            "Fit top": P[:, 1],
+            "Fit IC50": 10.0 ** P[:, 2],
+            "Fit Hill slope": P[:, 3],
+            "Fit R²": r2,
+            "Fit points": n,
+        },
+        index=pd.Index(names.take(np.concatenate([i for i, _, _ in batches])), name=id_col),
+    )
+
+
+def dose_response_columns(df: pd.DataFrame, fits: pd.DataFrame, id_col: str) -> pd.DataFrame:
+    """
+    FIT_COLUMNS for every row of df, looked up by compound id (NaN where the
+    compound was not fitted, or has no id). Returns only the new columns (same index as df).
+    """
+    pos = fits.index.get_indexer(df[id_col])
+    out = {}
+    for col in FIT_COLUMNS:
+        vals = fits[col].to_numpy(dtype="float64")
+        out[col] = np.where(pos >= 0, vals[pos] if len(vals) else np.nan, np.nan)
+    return pd.DataFrame(out, index=df.index)
+
+
+# ================= SQL =================
+SQL_TABLE = "data"
+SQL_SAMPLE_TABLE = "compounds"
+SQL_LOAD_CHUNK_ROWS = 100_000
+SQL_MAX_ROWS = 10_000
+SQL_TIMEOUT_SECONDS = 30.0
+# Actions a user query may perform (anything else, e.g. PRAGMA / ATTACH / writes, is denied).
+_SQL_ALLOWED = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+# A statement that is already an EXPLAIN is run as is (nothing to index for it).
+_EXPLAIN_RE = re.compile(r"\s*(?:(?:--[^\n]*(?:\n|$)|/\*.*?\*/)\s*)*explain\b", re.IGNORECASE | re.DOTALL)
+
+
+def _sql_authorizer(action, *_):
+    return sqlite3.SQLITE_OK if action in _SQL_ALLOWED else sqlite3.SQLITE_DENY
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Whitespace-collapsed query without trailing semicolons (result cache key).
+    """
+    return " ".join(sql.split()).rstrip("; ")
+
+
+class SqlEngine:
+    """
+    In-memory SQLite copy of one dataset (table `data`) plus the seeded sample
+    compound table (`compounds`) for joins. Shared by every session, so queries
+    run one at a time under a lock on a read-only connection. Columns a query
+    filters, joins, groups or sorts on get an index the first time they are
+    used, and every later query on the same dataset reuses it.
+    """
+
+    def __init__(self, df: pd.DataFrame, sample_df: pd.DataFrame = None):
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._indexed = set()
+        self.tables = {}
+        self._load(SQL_TABLE, df)
+        if sample_df is not None:
+            self._load(SQL_SAMPLE_TABLE, sample_df)
+        self._conn.execute("PRAGMA query_only = ON")
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the SQLite database (tables + indexes built so far).
+        """
+        with self._lock:
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return int(pages * page_size)
+
+    def _load(self, table: str, df: pd.DataFrame) -> None:
+        for start in range(0, max(len(df), 1), SQL_LOAD_CHUNK_ROWS):
+            df.iloc[start : start + SQL_LOAD_CHUNK_ROWS].to_sql(
+                table, self._conn, if_exists="replace" if start == 0 else "append", index=False
+            )
+        self.tables[table] = [str(c) for c in df.columns]
+
+    def _ensure_indexes(self, sql: str) -> None:
+        # columns named after the first FROM (WHERE / JOIN ... ON / GROUP BY / ORDER BY)
+        m = re.search(r"\bfrom\b", sql, flags=re.IGNORECASE)
+        if m is None:
+            return
+        tail = sql[m.end() :]
+        words = set(re.findall(r'"([^"]+)"|\[([^\]]+)\]|`([^`]+)`|\b(\w+)\b', tail))
+        named = {w for group in words for w in group if w}
+        self._conn.execute("PRAGMA query_only = OFF")
+        try:
+            for table, columns in self.tables.items():
+                for i, col in enumerate(columns):
+                    if col in named and (table, col) not in self._indexed:
+                        quoted = '"' + col.replace('"', '""') + '"'
+                        self._conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_{i}" ON "{table}" ({quoted})')
+                        self._indexed.add((table, col))
+        finally:
+            self._conn.execute("PRAGMA query_only = ON")
+
+    def query(self, sql: str, max_rows: int = SQL_MAX_ROWS, timeout: float = SQL_TIMEOUT_SECONDS):
+        """
+        Run one read-only statement; returns (result frame, truncated flag).
+        At most `max_rows` rows are fetched. sqlite3.Error propagates (including
+        "interrupted" once `timeout` seconds pass).
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._conn.set_progress_handler(lambda: time.monotonic() > deadline, 100_000)
+            self._conn.set_authorizer(_sql_authorizer)
+            try:
+                if not _EXPLAIN_RE.match(sql):
+                    # compile under the authorizer first: only accepted queries build indexes
+                    self._conn.execute("EXPLAIN " + sql).close()
+                    self._conn.set_authorizer(None)
+                    self._ensure_indexes(sql)
+                    self._conn.set_authorizer(_sql_authorizer)
+                cur = self._conn.execute(sql)
+                rows = cur.fetchmany(max_rows + 1)
+                names = [d[0] for d in cur.description or ()]
+            finally:
+                self._conn.set_authorizer(None)
+                self._conn.set_progress_handler(None, 0)
+        return pd.DataFrame.from_records(rows[:max_rows], columns=names), len(rows) > max_rows
+
+
+# ================= Background ingestion =================
+PREVIEW_ROWS = 1_000
+
+
+class IngestJob:
+    """
+    Parses + compacts a CSV upload on a daemon thread. The page polls `done`,
+    `rows` and `fraction`; `preview` holds the first rows as soon as the first
+    chunk is parsed; `result` / `stats` / `error` are set when it finishes.
+    """
+
+    def __init__(self, source, name: str = ""):
+        self.source = source
+        self.total_bytes = upload_size(source)
+        self.rows = 0
+        self.bytes_read = 0
+        self.preview = None
+        self.result = None
+        self.stats = RunningStats()
+        self.error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ingest:{name}", daemon=True)
+
+    def start(self) -> "IngestJob":
+        self._thread.start()
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def fraction(self) -> float:
+        return min(self.bytes_read / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    def _on_chunk(self, chunk: pd.DataFrame) -> None:
+        if self.preview is None:
+            self.preview = chunk.head(PREVIEW_ROWS).copy()
+        self.stats.update(chunk)
+
+    def _on_progress(self, rows: int, pos: int) -> None:
+        self.rows = rows
+        self.bytes_read = pos
+
+    def _run(self) -> None:
+        try:
+            self.source.seek(0)
+            df = read_csv_auto(self.source, on_chunk=self._on_chunk, on_progress=self._on_progress)
+            if not df.empty:
+                df, saved = compact_frame(df)
+                df.attrs["bytes_saved"] = saved
+            self.result = df
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+
+# ================= Export =================
+EXPORT_FORMATS = {"CSV": (".csv", "text/csv"), "Parquet": (".parquet", "application/vnd.apache.parquet")}
+EXPORT_CHUNK_ROWS = 250_000
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _export_schema(chunk: pd.DataFrame) -> pa.Schema:
+    # an all-null object column in the first chunk would be typed null; later chunks may hold text
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+def write_export(df: pd.DataFrame, path: str, fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS, on_progress=None) -> None:
+    """
+    Write df to `path` as CSV or Parquet one row slice at a time (one Parquet
+    row group per slice), so at most one serialized chunk is in memory.
+    on_progress(rows_written) is called after every chunk.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    starts = range(0, max(len(df), 1), chunk_rows)
+    if fmt == "CSV":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for start in starts:
+                chunk = df.iloc[start : start + chunk_rows]
+                chunk.to_csv(f, index=False, header=start == 0)
+                if on_progress is not None:
+                    on_progress(start + len(chunk))
+        return
+
+    schema = _export_schema(df.iloc[:chunk_rows])
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in starts:
+            chunk = df.iloc[start : start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            if on_progress is not None:
+                on_progress(start + len(chunk))
+
+
+class ExportJob:
+    """
+    Writes a dataset to a temporary file with write_export on a daemon thread.
+    The page polls `done` / `fraction`; `path` is the finished file and `error`
+    is set on failure. `tag` identifies what was exported (to spot stale jobs).
+    The file is deleted by discard(), or at the latest when the job is garbage
+    collected (e.g. with the session that owned it).
+    """
+
+    def __init__(self, df: pd.DataFrame, fmt: str, tag=None, directory: str = None):
+        suffix = EXPORT_FORMATS[fmt][0]
+        fd, self.path = tempfile.mkstemp(prefix="lab_export_", suffix=suffix, dir=directory)
+        os.close(fd)
+        self.df = df
+        self.fmt = fmt
+        self.tag = tag
+        self.total_rows = len(df)
+        self.rows_written = 0
+        self.error = None
+        self._discarded = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"export:{fmt}", daemon=True)
+        self._remove = weakref.finalize(self, _remove_file, self.path)
+
+    def start(self) -> "ExportJob":
+        self._thread.start()
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def fraction(self) -> float:
+        return min(self.rows_written / self.total_rows, 1.0) if self.total_rows else 1.0
+
+    @property
+    def ready(self) -> bool:
+        """
+        Finished without error and the file has not been discarded yet.
+        """
+        return self.done and self.error is None and not self._discarded
+
+    def read(self) -> bytes:
+        """
+        The exported file's bytes; the file is discarded once read (one download per job).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        finally:
+            self.discard()
+
+    def _on_progress(self, rows: int) -> None:
+        if self._discarded:
+            raise InterruptedError("export discarded")
+        self.rows_written = rows
+
+    def _run(self) -> None:
+        try:
+            write_export(self.df, self.path, self.fmt, on_progress=self._on_progress)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.df = None
+            with self._lock:
+                self._done.set()
+                discarded = self._discarded
+            if discarded:
+                self._remove()
+
+    def discard(self) -> None:
+        """
+        Delete the output file; a running export stops after its current chunk.
+        """
+        with self._lock:
+            self._discarded = True
+            if not self.done:
+                return
+        self._remove()
+
+
+# ================= Dataset cache =================
+def upload_digest(uploaded_file) -> str:
+    """
+    Content hash of an uploaded file; identical bytes give the same key.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with uploaded_file.getbuffer() as view:
+            h.update(view)
+    except AttributeError:
+        pos = uploaded_file.tell()
+        uploaded_file.seek(0)
+        for block in iter(lambda: uploaded_file.read(1 << 20), b""):
+            h.update(block)
+        uploaded_file.seek(pos)
+    return h.hexdigest()
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def object_nbytes(value) -> int:
+    """
+    Approximate memory held by a cached result: frames and series are measured,
+    arrays and objects with an `nbytes` attribute (RunningStats, SortedIndex,
+    SqlEngine) report their own size, containers are summed, anything else counts 0.
+    """
+    if isinstance(value, pd.DataFrame):
+        return frame_nbytes(value)
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sum(object_nbytes(v) for v in value)
+    return 0
+
+
+class DatasetCache:
+    """
+    Size-bounded LRU of parsed datasets keyed by content hash.
+    One instance is shared by every session, so all access is locked.
+    Datasets spilled to `spill_store` (see spill) are mapped back on get.
+    """
+
+    def __init__(self, max_bytes: int, spill_store=None):
+        self.max_bytes = max_bytes
+        self.spill_store = spill_store
+        self._entries = OrderedDict()  # key -> (df, nbytes, derived results by name, their nbytes by name)
+        self._spilled = {}  # key -> derived results kept while the frame is on disk
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def size_of(self, key):
+        """
+        Bytes charged to a dataset: the frame plus every derived result stored on it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[1] + sum(entry[3].values())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+            if key not in self._spilled:
+                return None
+        df = self.spill_store.get(key)
+        with self._lock:
+            derived = self._spilled.pop(key, None)
+            if df is None or derived is None:
+                return df
+            self.put(key, df)
+            for name, value in derived.items():
+                self.put_derived(key, name, value)
+        return df
+
+    def put(self, key, df: pd.DataFrame, nbytes: int = None) -> None:
+        """
+        `nbytes` overrides the measured frame size (lets the same LRU hold non-frame values).
+        """
+        size = frame_nbytes(df) if nbytes is None else nbytes
+        with self._lock:
+            self._drop(key)
+            self._spilled.pop(key, None)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (df, size, {}, {})
+            self._bytes += size
+            self._shrink(keep=key)
+
+    def derived(self, key, name, build):
+        """
+        Per-dataset memo: returns the result stored under `name`, or calls
+        build() once and keeps it for as long as the dataset stays cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and name in entry[2]:
+                return entry[2][name]
+        value = build()
+        self.put_derived(key, name, value)
+        return value
+
+    def put_derived(self, key, name, value, nbytes: int = None) -> None:
+        """
+        Store (or replace) a derived result; its size (measured with object_nbytes
+        unless `nbytes` is given) counts toward the dataset and the cache budget.
+        """
+        size = object_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[2][name] = value
+            self._bytes += size - entry[3].get(name, 0)
+            entry[3][name] = size
+            self._shrink(keep=key)
+
+    def _shrink(self, keep) -> None:
+        # evict least-recently-used datasets (never `keep`) until within budget
+        for old in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if old != keep:
+                self._drop(old)
+
+    def spill(self, key) -> None:
+        """
+        Move a dataset out of memory: write it to spill_store, then drop the
+        in-memory frame (or just drop it when there is no spill store). Small
+        derived results stay; per-row indexes, SQLite copies and SQL result
+        frames are as large as the data and are rebuilt on demand instead.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        if self.spill_store is not None:
+            try:
+                self.spill_store.put(key, entry[0])
+            except (OSError, pa.ArrowException):
+                return
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return  # replaced or evicted while writing
+            self._drop(key)
+            if self.spill_store is not None and key in self.spill_store:
+                self._spilled[key] = {
+                    name: v
+                    for name, v in entry[2].items()
+                    if not isinstance(v, (SortedIndex, SqlEngine)) and not name.startswith("sql:")
+                }
+
+    def _drop(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1] + sum(entry[3].values())
+
+
+class SessionBudget:
+    """
+    Memory accounting for one session: the datasets it has used (sizes as
+    charged by DatasetCache), least recently used first. A script run calls
+    begin_run(), touch() for every dataset it uses, then end_run(), which
+    returns the coldest datasets to spill while the session holds more than
+    `max_bytes`. Datasets touched during the run are pinned and never
+    returned, even when they alone exceed the budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._keys = OrderedDict()  # key -> nbytes
+        self._pinned = set()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def begin_run(self) -> None:
+        self._pinned = set()
+
+    def touch(self, key, nbytes: int) -> None:
+        self._bytes += nbytes - self._keys.pop(key, 0)
+        self._keys[key] = nbytes
+        self._pinned.add(key)
+
+    def end_run(self) -> list:
+        cold = []
+        for old in list(self._keys):
+            if self._bytes <= self.max_bytes:
+                break
+            if old not in self._pinned:
+                self._bytes -= self._keys.pop(old)
+                cold.append(old)
+        return cold
+
+
+# ================= On-disk store =================
+class DiskStore:
+    """
+    Persistent dataset store: one uncompressed Arrow IPC (Feather v2) file per key,
+    read back memory-mapped. Least-recently-used files (by mtime, touched on
+    every read) are deleted once the directory grows past `max_bytes`.
+    """
+
+    SUFFIX = ".arrow"
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key) -> str:
+        # hashed: keys can be longer than a file name allows, and must not collide
+        name = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.root, name + self.SUFFIX)
+
+    def __contains__(self, key) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return read_columnar(path, "ipc")
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def put(self, key, df: pd.DataFrame) -> None:
+        """
+        Best effort: an unwritable store (disk full, permissions) just stays a miss.
+        """
+        path = self._path(key)
+        try:
+            if os.path.exists(path):
+                os.utime(path)
+                return
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if table.nbytes > self.max_bytes:
+                return
+            # write-then-rename so concurrent readers never see a partial file
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            self._evict()
+        except OSError:
+            return
+
+    def _evict(self) -> None:
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                st_ = entry.stat()
+                files.append((st_.st_mtime, st_.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
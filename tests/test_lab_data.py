@@ -0,0 +1,302 @@
+import gc
+import io
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lab_data import (
+    DatasetCache,
+    DiskStore,
+    ExportJob,
+    SessionBudget,
+    SortedIndex,
+    RunningStats,
+    SqlEngine,
+    aggregate_bars,
+    align_frames,
+    compact_frame,
+    decimate_line,
+    dose_response_columns,
+    filter_mask,
+    fit_dose_response,
+    frame_nbytes,
+    fourpl,
+    histogram_kde,
+    lttb_indices,
+    read_columnar,
+    read_csv_auto,
+)
+
+CONCS = np.array([1, 3, 10, 30, 100, 300, 1000, 3000, 10000.0])
+
+
+def _series(compound_ic50s):
+    rows = []
+    for cid, ic50 in compound_ic50s:
+        for c in CONCS:
+            rows.append((cid, c, float(fourpl(np.log10(c), 0.0, 100.0, np.log10(ic50), 1.0))))
+    return pd.DataFrame(rows, columns=["Compound ID", "Conc", "Response"])
+
+
+def test_fit_skips_rows_without_compound_id():
+    df = _series([("A", 10.0), ("B", 1000.0), (None, 100.0)])
+    fits = fit_dose_response(df, "Compound ID", "Conc", "Response")
+    assert list(fits.index) == ["A", "B"]
+    np.testing.assert_allclose(fits["Fit IC50"], [10.0, 1000.0], rtol=1e-3)
+
+    cols = dose_response_columns(df, fits, "Compound ID")
+    assert cols["Fit IC50"].iloc[-len(CONCS):].isna().all()
+
+
+def test_disk_store_long_and_similar_keys(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=1 << 30)
+    long_key = "digest:" + ",".join(f"column_{i}" for i in range(200))
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    store.put(long_key, df)
+    assert store.get(long_key).equals(df)
+
+    store.put("abc:a b", pd.DataFrame({"a b": [1]}))
+    assert "abc:a_b" not in store
+    assert store.get("abc:a_b") is None
+
+
+def test_csv_invalid_utf8_past_sniff_window_is_decoded_as_latin1():
+    lines = ["id,name"] + [f"{i},name{i}" for i in range(20_000)] + ["20000,caf\xe9"]
+    df = read_csv_auto(io.BytesIO("\n".join(lines).encode("latin-1")))
+    assert df["name"].iloc[0] == "name0"
+    assert df["name"].iloc[-1] == "café"
+
+
+def test_aggregate_bars_same_axis_and_infinite_x():
+    df = pd.DataFrame({"a": np.r_[np.arange(200.0), np.inf], "b": np.arange(201.0)})
+    bars = aggregate_bars(df, "a", "a", max_bars=50)
+    assert list(bars.columns) == ["a", "mean of a"]
+    assert len(aggregate_bars(df, "a", "b", max_bars=50)) == 50
+
+
+def test_decimate_line_same_axis():
+    df = pd.DataFrame({"a": np.arange(1000.0)})
+    assert list(decimate_line(df, "a", "a", 100).columns) == ["a"]
+
+
+def test_dataset_cache_charges_derived_results():
+    cache = DatasetCache(max_bytes=1 << 30)
+    df = pd.DataFrame({"a": np.arange(10_000.0)})
+    cache.put("k", df)
+    frame_only = cache.size_of("k")
+    cache.derived("k", "index:a", lambda: SortedIndex(df["a"].to_numpy()))
+    assert cache.size_of("k") == frame_only + 2 * 8 * len(df)
+    assert cache.nbytes == cache.size_of("k")
+
+
+def test_spill_drops_sql_engine_and_results(tmp_path):
+    cache = DatasetCache(max_bytes=1 << 30, spill_store=DiskStore(str(tmp_path), max_bytes=1 << 30))
+    df = pd.DataFrame({"a": np.arange(1000.0)})
+    cache.put("k", df)
+    engine = cache.derived("k", "sql", lambda: SqlEngine(df))
+    assert cache.size_of("k") > frame_nbytes(df)
+    cache.derived("k", "sql:SELECT * FROM data", lambda: engine.query("SELECT * FROM data")[0])
+    cache.derived("k", "values:a", lambda: [1.0])
+    cache.spill("k")
+    assert "k" not in cache
+    assert cache.get("k").equals(df)
+    assert cache.derived("k", "values:a", lambda: None) == [1.0]
+    assert cache.derived("k", "sql", lambda: None) is None
+
+
+def test_sql_denied_statement_builds_no_index():
+    engine = SqlEngine(pd.DataFrame({"a": np.arange(100), "b": np.arange(100.0)}))
+    with pytest.raises(sqlite3.DatabaseError):
+        engine.query("DELETE FROM data WHERE a = 1")
+    assert engine._indexed == set()
+    out, truncated = engine.query("SELECT b FROM data WHERE a >= 98")
+    assert out["b"].tolist() == [98.0, 99.0] and not truncated
+    assert engine._indexed == {("data", "a")}
+
+
+def _finished(job):
+    while not job.done:
+        time.sleep(0.01)
+    return job
+
+
+def test_export_file_removed_after_read_or_gc():
+    df = pd.DataFrame({"a": np.arange(100)})
+    job = _finished(ExportJob(df, "CSV").start())
+    assert job.read().startswith(b"a\n0\n")
+    assert not os.path.exists(job.path) and not job.ready
+
+    job = _finished(ExportJob(df, "Parquet").start())
+    path = job.path
+    del job
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_read_columnar_feather_projection(tmp_path):
+    df = pd.DataFrame({"a": np.arange(5), "b": np.arange(5.0), "c": list("vwxyz")})
+    path = tmp_path / "t.feather"
+    df.to_feather(path)
+    out = read_columnar(str(path), "ipc", columns=["c", "a"])
+    assert list(out.columns) == ["c", "a"]
+    assert out["a"].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_session_budget_never_spills_datasets_used_this_run():
+    budget = SessionBudget(max_bytes=60)
+    for _ in range(3):  # base + filtered view together exceed the budget
+        budget.begin_run()
+        budget.touch("U", 40)
+        budget.touch("U|filter:x", 30)
+        assert budget.end_run() == []
+
+    budget.begin_run()
+    budget.touch("V", 10)
+    assert budget.end_run() == ["U"]  # coldest unused first, only until within budget
+    assert budget.nbytes == 40
+
+
+def _numeric_frame(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(5.0, 2.0, n)
+    x[rng.choice(n, 50, replace=False)] = np.nan
+    return pd.DataFrame(
+        {
+            "x": x,
+            "k": rng.integers(-100, 100, n),
+            "tag": pd.Categorical(rng.choice(["a", "b", "c"], n)),
+            "name": rng.choice(["p", "q", "r"], n).astype(object),
+        }
+    )
+
+
+def test_filter_mask_matches_plain_comparison():
+    df = _numeric_frame()
+    x = df["x"].to_numpy()
+    for lo, hi in [(4.0, 6.0), (None, 3.0), (7.0, None), (None, None), (6.0, 4.0)]:
+        expected = ~np.isnan(x)
+        if lo is not None:
+            expected &= x >= lo
+        if hi is not None:
+            expected &= x <= hi
+        assert np.array_equal(SortedIndex(x).range_mask(lo, hi), expected)
+        filters = [("range", "x", lo, hi)]
+        assert np.array_equal(filter_mask(df, filters), expected)
+        assert np.array_equal(filter_mask(df, filters, index_for=lambda c: SortedIndex(df[c])), expected)
+
+    filters = [("in", "tag", ["a", "zz"]), ("in", "name", ["p", "q"]), ("range", "k", 0, None)]
+    expected = (df["tag"] == "a") & df["name"].isin(["p", "q"]) & (df["k"] >= 0)
+    assert np.array_equal(filter_mask(df, filters), expected.to_numpy())
+
+
+def test_running_stats_chunks_merge_and_hstack_match_describe():
+    df = _numeric_frame()
+    expected = df.describe().T
+    cols = list(expected.columns)
+
+    def check(stats):
+        np.testing.assert_allclose(stats.to_frame().loc[expected.index, cols], expected, rtol=1e-9)
+
+    check(RunningStats.from_frame(df, chunk_rows=97))
+    half = RunningStats.from_frame(df.iloc[:400])
+    half.merge(RunningStats.from_frame(df.iloc[400:]))
+    check(half)
+    check(RunningStats.hstack([RunningStats.from_frame(df[["x"]]), RunningStats.from_frame(df[["k", "name"]])]))
+    assert RunningStats.from_frame(df).rows == len(df)
+
+
+def test_compact_frame_is_lossless_and_smaller():
+    n = 1000
+    df = pd.DataFrame(
+        {
+            "small": np.arange(n) % 100,
+            "integral": (np.arange(n) % 7).astype("float64"),
+            "f32": np.arange(n) * 0.5,
+            "tiny": np.arange(n) * 1e-300,  # underflows in float32
+            "repeated": np.array(["x", "y"] * (n // 2), dtype=object),
+            "unique": np.array([f"id{i}" for i in range(n)], dtype=object),
+        }
+    )
+    out, saved = compact_frame(df)
+    assert saved == frame_nbytes(df) - frame_nbytes(out) > 0
+    assert out["small"].dtype.itemsize == 1
+    assert pd.api.types.is_integer_dtype(out["integral"])
+    assert out["f32"].dtype == np.float32
+    assert out["tiny"].dtype == np.float64
+    assert isinstance(out["repeated"].dtype, pd.CategoricalDtype)
+    assert out["unique"].dtype == "string[pyarrow]"
+    for c in df.columns:
+        assert out[c].astype(df[c].dtype).tolist() == df[c].tolist()
+
+
+def test_compact_frame_prefers_signed_ints():
+    df = pd.DataFrame({"big": [0, 1, 2**40], "ids": [1, 2, 300], "byte": [0, 1, 200], "neg": [-1, 0, 5]})
+    out, _ = compact_frame(df)
+    assert out["big"].dtype == np.int64
+    assert out["ids"].dtype == np.int16  # uint16 is no smaller
+    assert out["byte"].dtype == np.uint8  # uint8 halves int16
+    assert out["neg"].dtype == np.int8
+
+
+def test_align_frames_union_and_intersection_dtypes():
+    a = pd.DataFrame({"id": [1, 2], "v": [0.5, 1.5], "s": ["x", "y"]})
+    b = pd.DataFrame({"id": [3], "v": [2], "w": [7]})
+    union = align_frames([a, b], ["a.csv", "b.csv"], how="union")
+    assert list(union.columns) == ["id", "v", "s", "w", "Source file"]
+    assert union["id"].dtype == "int64"
+    assert union["v"].dtype == "float64"
+    assert union["s"].dtype == "string[pyarrow]" and union["s"].isna().tolist() == [False, False, True]
+    assert union["w"].dtype == "float64" and union["w"].isna().tolist() == [True, True, False]
+    assert union["Source file"].tolist() == ["a.csv", "a.csv", "b.csv"]
+
+    inter = align_frames([a, b], ["a.csv", "b.csv"], how="intersection", source_col=None)
+    assert list(inter.columns) == ["id", "v"]
+    assert inter["id"].dtype == "int64" and inter["v"].dtype == "float64"
+
+
+def test_lttb_indices_keep_ends_and_spikes():
+    x = np.arange(10_000.0)
+    y = np.zeros_like(x)
+    y[4321] = 100.0
+    idx = lttb_indices(x, y, 200)
+    assert len(idx) == 200 and idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert 4321 in idx
+    assert np.array_equal(lttb_indices(x[:50], y[:50], 200), np.arange(50))
+
+
+def test_histogram_kde_counts_and_scale():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(0.0, 1.0, 5000), [np.nan, np.inf, -np.inf]])
+    counts, edges, grid, kde = histogram_kde(values, bins=40, grid_points=400)
+    assert counts.sum() == 5000 and len(edges) == 41
+    assert len(grid) == len(kde) == 400
+    # kde is in counts per histogram bin: integrating it over the bins gives the row count
+    assert abs(kde.sum() * 40 / 400 - 5000) < 0.05 * 5000
+
+    counts, *_ = histogram_kde(np.array([-1.0, 0.0, 1.0, 10.0, 100.0]), bins=4, log=True)
+    assert counts.sum() == 3
+    assert all(len(part) == 0 for part in histogram_kde([np.nan]))
+
+
+def test_sql_denies_writes_pragma_and_attach():
+    df = pd.DataFrame({"a": np.arange(10)})
+    engine = SqlEngine(df)
+    for sql in [
+        "INSERT INTO data VALUES (1)",
+        "UPDATE data SET a = 0",
+        "DELETE FROM data",
+        "DROP TABLE data",
+        "CREATE TABLE t (x)",
+        "PRAGMA query_only = OFF",
+        "PRAGMA table_info(data)",
+        "ATTACH DATABASE ':memory:' AS other",
+    ]:
+        with pytest.raises(sqlite3.DatabaseError):
+            engine.query(sql)
+    out, _ = engine.query("SELECT a FROM data ORDER BY a")
+    assert out["a"].tolist() == df["a"].tolist()